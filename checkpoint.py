@@ -0,0 +1,94 @@
+"""
+检查点模块 - 各阶段结果以 JSON 行追加写入，中断后可从断点继续
+"""
+import json
+import logging
+import os
+from typing import Dict, List
+from config import CHECKPOINT_DIR
+
+logger = logging.getLogger(__name__)
+
+DONE_MARKER = '_done'
+
+
+class Checkpoint:
+    """单个阶段的检查点文件
+
+    每处理完一条记录立即追加一行，阶段全部完成后追加结束标记。
+    读取时截掉中断造成的不完整末行，后续追加从完整的行尾开始。
+    """
+
+    def __init__(self, stage: str, directory: str = CHECKPOINT_DIR):
+        self.stage = stage
+        self.path = os.path.join(directory, f"{stage}.jsonl")
+        self.records: List[Dict] = []
+        self.done = False
+        self._file = None
+        self.load()
+
+    def load(self):
+        """读取已有记录"""
+        self.records = []
+        self.done = False
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+
+        # 末行没有换行符说明写入被中断，截掉它，避免下一条记录接在残行后面
+        complete = data.rfind(b'\n') + 1
+        if complete < len(data):
+            logger.warning(f"检查点 {self.path} 末行不完整，已截断")
+            with open(self.path, 'r+b') as f:
+                f.truncate(complete)
+
+        for line in data[:complete].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get(DONE_MARKER):
+                self.done = True
+            else:
+                self.records.append(record)
+
+    def append(self, record: Dict):
+        """追加一条记录并立即落盘"""
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self._file.flush()
+        self.records.append(record)
+
+    def finish(self):
+        """写入阶段结束标记"""
+        self.append({DONE_MARKER: True})
+        self.records.pop()
+        self.done = True
+        self.close()
+
+    def reset(self):
+        """清空检查点，重新开始该阶段"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self.records = []
+        self.done = False
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def processed_keys(self) -> set:
+        """已处理过的节点键"""
+        return {record['key'] for record in self.records if 'key' in record}
+
+    def nodes(self) -> List[Dict]:
+        """已记录且结果有效的节点"""
+        return [record['node'] for record in self.records if record.get('node') is not None]
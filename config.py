@@ -7,6 +7,35 @@ GITHUB_REPOS = [
     "ripaojiedian/free-ssr-ss-v2ray-vless-clash",
 ]
 
+# 爬取设置
+GITHUB_RAW_URL = "https://raw.githubusercontent.com"  # 原始文件地址
+CRAWL_BRANCHES = ["main", "master"]  # 依次尝试的分支
+CRAWL_FILE_EXTENSIONS = ['.yaml', '.yml', '.txt', '.json']  # 候选文件扩展名
+CRAWL_MIN_FILE_SIZE = 64  # 候选文件最小字节数
+CRAWL_MAX_FILE_SIZE = 8 * 1024 * 1024  # 候选文件最大字节数
+CRAWL_NAME_KEYWORDS = [  # 文件名包含这些关键字时优先抓取
+    "clash", "sub", "node", "proxy", "proxies", "v2ray", "vmess",
+    "vless", "trojan", "ss", "ssr", "free", "list", "config",
+]
+CRAWL_EXCLUDE_KEYWORDS = [  # 路径中某一级目录/文件名或其中的单词与这些关键字相同时跳过
+    ".github", "readme", "license", "requirements", "package",
+    "rule", "rules", "filter", "filters", "adblock", "test", "tests",
+]
+CRAWL_CHUNK_SIZE = 64 * 1024  # 流式下载块大小（字节）
+
+# 节点源统计设置
+OUTPUT_SOURCE_STATS = "source_stats.json"  # 节点源统计（跨次运行保存）
+CRAWL_FILE_BUDGET = 100  # 每次运行最多抓取的文件数，按仓库产出分配
+SOURCE_MIN_FILES = 3  # 每个待爬仓库至少分配的文件数
+SOURCE_BASE_INTERVAL = 7200  # 仓库首次无产出后的爬取间隔（秒），之后逐次翻倍
+SOURCE_MAX_INTERVAL = 7 * 24 * 3600  # 无产出仓库的最大爬取间隔（秒）
+SOURCE_DEAD_RUNS = 3  # 文件连续多少次无产出后排到最后
+SOURCE_EMA_ALPHA = 0.5  # 产出滑动平均的权重
+
+# 解析设置
+PARSE_WORKERS = 0  # 解析进程数（0 表示与 CPU 核数一致）
+PARSE_POOL_MIN_SIZE = 256 * 1024  # 超过该大小（字节）的文件交给解析进程池
+
 # 测试目标网站
 TEST_URLS = {
     "youtube": "https://www.youtube.com",
@@ -19,6 +48,13 @@ TEST_URLS = {
 SPEED_TEST_URL = "https://www.google.com/generate_204"
 MIN_SPEED = 100  # 最小速度 (KB/s)
 MAX_SPEED = 300  # 最大速度 (KB/s)
+SPEED_TEST_MODE = "quick"  # quick: 单次小文件下载; throughput: 复用连接按时间窗口测持续带宽
+THROUGHPUT_URL = "https://speed.cloudflare.com/__down?bytes=104857600"  # 持续带宽测试地址（需足够大）
+THROUGHPUT_WINDOW = 8  # 带宽测量时间窗口（秒）
+THROUGHPUT_SAMPLE_INTERVAL = 0.5  # 带宽采样间隔（秒）
+THROUGHPUT_STREAMS = 1  # 并行下载流数量（>1 时可暴露单连接限速）
+THROUGHPUT_WARMUP_TIMEOUT = 5  # 预热连接超时（秒）
+THROUGHPUT_MAX_SPEED = 0  # 持续带宽模式的速度上限 (KB/s)，0 表示不设上限
 
 # 超时设置
 TIMEOUT = 10  # 连接超时（秒）
@@ -27,8 +63,50 @@ TEST_TIMEOUT = 15  # 测试超时（秒）
 # 并发设置
 MAX_CONCURRENT = 20  # 最大并发数
 
+# 守护进程设置
+DAEMON_CRAWL_INTERVAL = 1800  # 重新爬取节点源的间隔（秒）
+DAEMON_PROBE_WORKERS = MAX_CONCURRENT  # 同时探测的节点数上限
+DAEMON_MIN_PROBE_INTERVAL = 60  # 状态变化节点的探测间隔（秒）
+DAEMON_MAX_PROBE_INTERVAL = 1800  # 稳定节点的最大探测间隔（秒）
+DAEMON_PROBE_JITTER = 0.2  # 探测间隔随机抖动比例
+DAEMON_MAX_FAILURES = 5  # 连续失败多少次后移出节点集合
+DAEMON_PUBLISH_DEBOUNCE = 10  # 可用节点变化后延迟发布（秒）
+
+# 订阅服务设置
+SERVER_HOST = "0.0.0.0"  # 监听地址
+SERVER_PORT = 8080  # 监听端口
+SERVER_CACHE_SIZE = 512  # 最多缓存的筛选视图数
+SERVER_KEEPALIVE_TIMEOUT = 30  # 空闲连接超时（秒）
+SERVER_GZIP_LEVEL = 6  # gzip 压缩级别
+SERVER_BROTLI_QUALITY = 5  # brotli 压缩质量（0-11）
+SERVER_RELOAD_INTERVAL = 10  # 仅订阅服务模式下检查索引快照/变更记录是否更新的间隔（秒）
+
 # 输出文件
 OUTPUT_NODES_TXT = "nodes.txt"
 OUTPUT_NODES_JSON = "nodes.json"
+OUTPUT_NODES_INDEX = "nodes.idx"  # 节点索引快照
+OUTPUT_CHANGES = "changes.jsonl"  # 变更记录（追加写入）
+CHANGE_FEED_MAX = 200  # 变更记录最多保留的条数
+CHANGE_SPEED_DELTA = 0.2  # 速度相对变化超过该比例才记为指标变化
+CHANGE_RTT_DELTA = 50  # 连接延迟变化超过该值（毫秒）才记为指标变化
 LOG_FILE = "log.txt"
 
+# 检查点设置
+CHECKPOINT_DIR = ".checkpoints"  # 各阶段检查点目录
+
+# 日志设置
+LOG_FORMAT = "text"  # 日志文件格式: text 或 json（JSON 行）
+LOG_MAX_BYTES = 512 * 1024  # 单个日志文件最大字节数，超过后轮转
+LOG_BACKUP_COUNT = 1  # 保留的轮转日志个数
+LOG_NODE_EVENT_SAMPLE = 20  # 每个时间窗口最多输出的逐节点日志条数
+LOG_NODE_EVENT_WINDOW = 60  # 逐节点日志采样窗口（秒）
+
+# IP 归属地设置
+GEOIP_CSV = "geoip.csv"  # 原始 IP 区间 CSV（start_ip,end_ip,country[,asn]）
+GEOIP_DB = "geoip.bin"  # 构建后的二进制区间表
+REGION_TEST_INTERVAL = 300  # 地区 url-test 分组的测速间隔（秒）
+
+# 索引设置
+INDEX_SPEED_BUCKET = 50  # 速度索引桶宽（KB/s）
+INDEX_RTT_BUCKET = 100  # 延迟索引桶宽（毫秒）
+
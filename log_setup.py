@@ -0,0 +1,105 @@
+"""
+日志配置模块 - 队列后台写入、按大小轮转、JSON 行格式、逐节点日志采样
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from typing import Optional
+from config import (
+    LOG_FILE, LOG_FORMAT, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_NODE_EVENT_SAMPLE, LOG_NODE_EVENT_WINDOW,
+)
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 打上该标记的日志视为逐节点事件: logger.info(..., extra=NODE_EVENT)
+NODE_EVENT = {'node_event': True}
+
+
+class JsonFormatter(logging.Formatter):
+    """JSON 行格式"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': self.formatTime(record),
+            'name': record.name,
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class NodeEventSampler(logging.Filter):
+    """逐节点事件采样：每个时间窗口只放行前 N 条，其余只计数并在窗口结束时汇总"""
+
+    def __init__(self, sample: int = LOG_NODE_EVENT_SAMPLE, window: float = LOG_NODE_EVENT_WINDOW):
+        super().__init__()
+        self.sample = sample
+        self.window = window
+        self.window_start = time.monotonic()
+        self.passed = 0
+        self.suppressed = 0
+
+    def flush(self):
+        """输出当前窗口被省略的事件数"""
+        if self.suppressed:
+            suppressed, self.suppressed = self.suppressed, 0
+            logging.getLogger(__name__).info(f"已省略 {suppressed} 条逐节点日志")
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, 'node_event', False):
+            return True
+
+        now = time.monotonic()
+        if now - self.window_start >= self.window:
+            self.window_start = now
+            self.passed = 0
+            self.flush()
+
+        if self.passed < self.sample:
+            self.passed += 1
+            return True
+        self.suppressed += 1
+        return False
+
+
+def setup_logging(level: int = logging.INFO, log_format: str = LOG_FORMAT,
+                  log_file: Optional[str] = LOG_FILE) -> logging.handlers.QueueListener:
+    """配置根日志：调用方只把记录放进队列，由后台线程写文件和控制台"""
+    file_formatter = JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT)
+    handlers = []
+    if log_file:
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+        file_handler.setFormatter(file_formatter)
+        handlers.append(file_handler)
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    handlers.append(console_handler)
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    sampler = NodeEventSampler()
+    queue_handler.addFilter(sampler)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+
+    def shutdown():
+        sampler.flush()
+        listener.stop()
+
+    atexit.register(shutdown)
+    return listener
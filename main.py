@@ -1,70 +1,195 @@
 """
 主程序入口
+
+用法:
+    python main.py [run]        完整流程（爬取 -> 验证 -> 测速 -> 导出），中断后再次运行会从检查点继续
+    python main.py crawl        只爬取节点
+    python main.py validate     只验证节点可用性
+    python main.py speedtest    只测速
+    python main.py export       把测速结果导出为输出文件
+    python main.py daemon       常驻模式（同时提供订阅服务）
+    python main.py serve        只提供订阅服务
+
+各子命令只在需要时才导入 aiohttp / requests / yaml 等较重的依赖。
 """
+import argparse
 import asyncio
 import logging
-import sys
 from datetime import datetime
-from config import GITHUB_REPOS, LOG_FILE
-from node_crawler import GitHubNodeCrawler
-from node_validator import NodeValidator
-from node_speedtest import NodeSpeedTest
-from node_storage import NodeStorage
-
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE, encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+from typing import Dict, List
+from config import GITHUB_REPOS, LOG_FORMAT
+from checkpoint import Checkpoint
+from log_setup import setup_logging
 
 logger = logging.getLogger(__name__)
 
+STAGES = ['crawl', 'validate', 'speedtest', 'export']
+
+
+def open_checkpoints(fresh_from: str = None) -> Dict[str, Checkpoint]:
+    """打开各阶段检查点；fresh_from 指定的阶段及其后续阶段从头开始"""
+    checkpoints = {stage: Checkpoint(stage) for stage in STAGES}
+    if fresh_from:
+        for stage in STAGES[STAGES.index(fresh_from):]:
+            checkpoints[stage].reset()
+    return checkpoints
+
+
+def stage_crawl(checkpoints: Dict[str, Checkpoint]) -> List[Dict]:
+    """阶段 1: 爬取节点"""
+    checkpoint = checkpoints['crawl']
+    # 爬取结果为空（例如触发限流或所有仓库都在退避中）时不复用，下次重新爬取
+    if checkpoint.done and checkpoint.records:
+        logger.info(f"爬取阶段已完成，使用检查点中的 {len(checkpoint.records)} 个节点")
+        return checkpoint.nodes()
+    
+    from node_crawler import GitHubNodeCrawler, node_key
+    from source_stats import SourceStats
+    
+    # 爬取结果整体返回，未完成的爬取无法续跑，直接重来；后续阶段的旧记录一并作废
+    for stage in STAGES:
+        checkpoints[stage].reset()
+    stats = SourceStats.load()
+    crawler = GitHubNodeCrawler(stats)
+    all_nodes = crawler.crawl_all(GITHUB_REPOS)
+    stats.save()
+    for node in all_nodes:
+        checkpoint.append({'key': node_key(node), 'node': node})
+    checkpoint.finish()
+    logger.info(f"共爬取到 {len(all_nodes)} 个节点")
+    return all_nodes
+
+
+def pending_records(source: Checkpoint, checkpoint: Checkpoint) -> List[Dict]:
+    """上一阶段的有效记录中，本阶段尚未处理的部分"""
+    processed = checkpoint.processed_keys()
+    if processed:
+        logger.info(f"从检查点继续，跳过已处理的 {len(processed)} 个节点")
+    return [record for record in source.records
+            if record.get('node') is not None and record['key'] not in processed]
+
+
+async def stage_validate(checkpoints: Dict[str, Checkpoint]) -> List[Dict]:
+    """阶段 2: 验证节点可用性"""
+    checkpoint = checkpoints['validate']
+    if checkpoint.done:
+        logger.info(f"验证阶段已完成，使用检查点中的 {len(checkpoint.nodes())} 个可用节点")
+        return checkpoint.nodes()
+    if not checkpoints['crawl'].done:
+        logger.warning("爬取阶段尚未完成，请先运行 crawl")
+        return []
+    
+    from node_validator import NodeValidator
+    
+    records = pending_records(checkpoints['crawl'], checkpoint)
+    keys = {id(record['node']): record['key'] for record in records}
+    validator = NodeValidator()
+    await validator.validate_nodes(
+        [record['node'] for record in records],
+        on_result=lambda node, result: checkpoint.append({'key': keys[id(node)], 'node': result})
+    )
+    checkpoint.finish()
+    
+    valid_nodes = checkpoint.nodes()
+    logger.info(f"验证完成，共 {len(valid_nodes)} 个可用节点")
+    
+    # 按来源记录验证通过数，供下次分配爬取预算
+    from source_stats import SourceStats
+    stats = SourceStats.load()
+    stats.record_validated(valid_nodes)
+    stats.save()
+    return valid_nodes
+
+
+async def stage_speedtest(checkpoints: Dict[str, Checkpoint]) -> List[Dict]:
+    """阶段 3: 测速"""
+    checkpoint = checkpoints['speedtest']
+    if not checkpoint.done:
+        if not checkpoints['validate'].done:
+            logger.warning("验证阶段尚未完成，请先运行 validate")
+            return []
+        
+        from node_speedtest import NodeSpeedTest
+        
+        records = pending_records(checkpoints['validate'], checkpoint)
+        keys = {id(record['node']): record['key'] for record in records}
+        speedtest = NodeSpeedTest()
+        await speedtest.test_nodes_speed(
+            [record['node'] for record in records],
+            on_result=lambda node, result: checkpoint.append({'key': keys[id(node)], 'node': result})
+        )
+        checkpoint.finish()
+    
+    # 按速度排序
+    speed_ok_nodes = checkpoint.nodes()
+    speed_ok_nodes.sort(key=lambda x: x.get('speed', 0), reverse=True)
+    logger.info(f"测速完成，共 {len(speed_ok_nodes)} 个节点速度在范围内")
+    return speed_ok_nodes
+
 
-async def main():
-    """主函数"""
+def stage_export(checkpoints: Dict[str, Checkpoint]) -> List[Dict]:
+    """阶段 4: 保存结果"""
+    if not checkpoints['speedtest'].done:
+        logger.warning("测速阶段尚未完成，请先运行 speedtest")
+        return []
+    
+    from node_geoip import annotate_nodes
+    from node_storage import NodeStorage
+    
+    speed_ok_nodes = checkpoints['speedtest'].nodes()
+    speed_ok_nodes.sort(key=lambda x: x.get('speed', 0), reverse=True)
+    annotate_nodes(speed_ok_nodes)
+    NodeStorage.save_all(speed_ok_nodes)
+    checkpoints['export'].reset()
+    checkpoints['export'].finish()
+    return speed_ok_nodes
+
+
+def restart_next_run():
+    """完整流程因结果为空提前结束时清空检查点，下次运行从爬取重新开始，而不是复用空结果"""
+    open_checkpoints(fresh_from='crawl')
+
+
+async def main(fresh: bool = False):
+    """完整流程"""
     logger.info("=" * 50)
     logger.info("开始节点爬取和验证流程")
     logger.info(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     logger.info("=" * 50)
     
     try:
+        # 上一次完整流程已导出时重新开始，否则从检查点继续
+        checkpoints = open_checkpoints()
+        if fresh or checkpoints['export'].done:
+            checkpoints = open_checkpoints(fresh_from='crawl')
+        
         # 1. 爬取节点
         logger.info("步骤 1: 开始爬取节点...")
-        crawler = GitHubNodeCrawler()
-        all_nodes = crawler.crawl_all(GITHUB_REPOS)
-        logger.info(f"共爬取到 {len(all_nodes)} 个节点")
+        all_nodes = stage_crawl(checkpoints)
         
         if not all_nodes:
             logger.warning("未爬取到任何节点，请检查网络连接和仓库配置")
-            return
+            return restart_next_run()
         
         # 2. 验证节点可用性
         logger.info("步骤 2: 开始验证节点可用性...")
-        validator = NodeValidator()
-        valid_nodes = await validator.validate_nodes(all_nodes)
-        logger.info(f"验证完成，共 {len(valid_nodes)} 个可用节点")
+        valid_nodes = await stage_validate(checkpoints)
         
         if not valid_nodes:
             logger.warning("没有可用的节点")
-            return
+            return restart_next_run()
         
         # 3. 测速
         logger.info("步骤 3: 开始测速...")
-        speedtest = NodeSpeedTest()
-        speed_ok_nodes = await speedtest.test_nodes_speed(valid_nodes)
-        logger.info(f"测速完成，共 {len(speed_ok_nodes)} 个节点速度在范围内")
+        speed_ok_nodes = await stage_speedtest(checkpoints)
         
         if not speed_ok_nodes:
             logger.warning("没有速度在范围内的节点")
-            return
+            return restart_next_run()
         
         # 4. 保存结果
         logger.info("步骤 4: 保存结果...")
-        NodeStorage.save_all(speed_ok_nodes)
+        stage_export(checkpoints)
         
         # 5. 统计信息
         logger.info("=" * 50)
@@ -88,12 +213,85 @@ async def main():
             logger.info(f"  {site}: {count} 个节点可访问")
         
         logger.info("=" * 50)
-        
+    
     except Exception as e:
         logger.error(f"程序执行出错: {e}", exc_info=True)
         raise
 
 
-if __name__ == "__main__":
-    asyncio.run(main())
+def run_daemon():
+    """常驻模式：持续爬取、探测并增量发布，同时提供订阅服务"""
+    from node_daemon import NodeMonitorDaemon
+    from node_storage import NodeStorage
+    from subscription_server import SubscriptionServer
+    
+    daemon = NodeMonitorDaemon()
+    server = SubscriptionServer()
+    server.update(NodeStorage.load_from_json())
+    daemon.add_publisher(server.update)
+    asyncio.run(daemon.run(extra_tasks=[server.serve_forever()]))
+
 
+def run_server():
+    """仅提供订阅服务（使用已发布的索引快照，快照更新后自动重新加载）"""
+    from node_storage import NodeStorage
+    from subscription_server import SubscriptionServer
+    
+    async def serve(server: SubscriptionServer):
+        await asyncio.gather(server.serve_forever(), server.watch_snapshot())
+    
+    server = SubscriptionServer()
+    server.update_index(NodeStorage.load_index())
+    asyncio.run(serve(server))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """命令行参数"""
+    parser = argparse.ArgumentParser(description="免费节点自动爬取与验证系统")
+    parser.add_argument('--log-format', choices=['text', 'json'], default=LOG_FORMAT,
+                        help="日志文件格式")
+    
+    subparsers = parser.add_subparsers(dest='command')
+    # 不带子命令时执行完整流程（定时任务直接运行 python main.py）
+    parser.set_defaults(command='run', fresh=False)
+    for name, help_text in [
+        ('run', "完整流程"),
+        ('crawl', "爬取节点"),
+        ('validate', "验证节点可用性"),
+        ('speedtest', "测速"),
+    ]:
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument('--fresh', action='store_true',
+                               help="忽略检查点，从该阶段重新开始（后续阶段一并清空）")
+    # 导出每次都按测速检查点重新生成，没有可跳过的进度
+    subparsers.add_parser('export', help="导出输出文件")
+    subparsers.add_parser('daemon', help="常驻模式")
+    subparsers.add_parser('serve', help="订阅服务")
+    return parser
+
+
+def cli(argv: List[str] = None):
+    """命令行入口"""
+    args = build_parser().parse_args(argv)
+    if args.command is None:
+        args.command = 'run'
+    setup_logging(log_format=args.log_format)
+    
+    if args.command == 'run':
+        asyncio.run(main(fresh=args.fresh))
+    elif args.command == 'crawl':
+        stage_crawl(open_checkpoints('crawl' if args.fresh else None))
+    elif args.command == 'validate':
+        asyncio.run(stage_validate(open_checkpoints('validate' if args.fresh else None)))
+    elif args.command == 'speedtest':
+        asyncio.run(stage_speedtest(open_checkpoints('speedtest' if args.fresh else None)))
+    elif args.command == 'export':
+        stage_export(open_checkpoints())
+    elif args.command == 'daemon':
+        run_daemon()
+    elif args.command == 'serve':
+        run_server()
+
+
+if __name__ == "__main__":
+    cli()
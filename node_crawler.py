@@ -1,67 +1,167 @@
 """
 GitHub 节点爬虫模块
 """
+import os
 import re
+import codecs
+import multiprocessing
 import requests
 import base64
-from typing import List, Dict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Dict, Iterator, Optional, Tuple
 import logging
+from source_stats import SourceStats
+from config import (
+    GITHUB_RAW_URL, CRAWL_BRANCHES, CRAWL_FILE_EXTENSIONS, CRAWL_MIN_FILE_SIZE,
+    CRAWL_MAX_FILE_SIZE, CRAWL_NAME_KEYWORDS, CRAWL_EXCLUDE_KEYWORDS, CRAWL_CHUNK_SIZE,
+    PARSE_WORKERS, PARSE_POOL_MIN_SIZE,
+)
 
 logger = logging.getLogger(__name__)
 
 
+def node_key(node: Dict) -> str:
+    """节点去重键"""
+    return f"{node.get('server', '')}:{node.get('port', '')}"
+
+
+def compact_nodes(nodes: List[Dict]) -> List[Dict]:
+    """按去重键压缩节点列表，保留首次出现的节点"""
+    unique_nodes = []
+    seen = set()
+    for node in nodes:
+        key = node_key(node)
+        if key not in seen:
+            seen.add(key)
+            unique_nodes.append(node)
+    return unique_nodes
+
+
+class _WorkerLogCollector(logging.Handler):
+    """解析进程内收集警告和错误日志，随结果一起交回主进程记录"""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.messages: List[Tuple[int, str]] = []
+
+    def emit(self, record: logging.LogRecord):
+        self.messages.append((record.levelno, record.getMessage()))
+
+
+_worker_logs = _WorkerLogCollector()
+
+
+def init_parse_worker():
+    """解析进程初始化：日志只写入收集器，不使用主进程的日志队列"""
+    root = logging.getLogger()
+    root.handlers = [_worker_logs]
+    root.setLevel(logging.WARNING)
+
+
+def parse_file_content(path: str, content: str) -> Tuple[List[Dict], List[Tuple[int, str]]]:
+    """解析完整文件内容（在解析进程池中执行），返回压缩后的节点批次和解析期间的日志"""
+    _worker_logs.messages = []
+    nodes = compact_nodes(GitHubNodeCrawler.parse_stream(path, iter([content])))
+    return nodes, _worker_logs.messages
+
+
 class GitHubNodeCrawler:
     """从 GitHub 爬取节点"""
     
-    def __init__(self):
+    def __init__(self, stats: Optional[SourceStats] = None):
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
+        self.parse_pool: Optional[ProcessPoolExecutor] = None
+        # 节点源统计：决定爬哪些仓库、每个仓库抓多少文件以及抓取顺序
+        self.stats = stats
+        self.fetched_bytes = 0
     
-    def get_github_file_content(self, repo: str, file_path: str) -> str:
-        """获取 GitHub 文件内容"""
-        try:
-            # 使用 GitHub API
-            api_url = f"https://api.github.com/repos/{repo}/contents/{file_path}"
-            response = self.session.get(api_url, timeout=10)
-            
-            if response.status_code == 200:
+    def list_repo_tree(self, repo: str) -> Tuple[Optional[str], List[Dict]]:
+        """一次性列出仓库文件树，返回 (分支, [{'path', 'size'}])"""
+        for branch in CRAWL_BRANCHES:
+            try:
+                api_url = f"https://api.github.com/repos/{repo}/git/trees/{branch}?recursive=1"
+                response = self.session.get(api_url, timeout=10)
+                if response.status_code != 200:
+                    continue
+                
                 data = response.json()
-                if data.get('encoding') == 'base64':
-                    content = base64.b64decode(data['content']).decode('utf-8')
-                    return content
-            return ""
-        except Exception as e:
-            logger.error(f"获取文件内容失败 {repo}/{file_path}: {e}")
-            return ""
+                if data.get('truncated'):
+                    logger.warning(f"仓库 {repo} 文件树被截断，部分文件可能遗漏")
+                
+                blobs = []
+                for item in data.get('tree', []):
+                    if item.get('type') == 'blob':
+                        blobs.append({'path': item['path'], 'size': item.get('size', 0)})
+                return branch, blobs
+            except Exception as e:
+                logger.error(f"获取文件树失败 {repo}@{branch}: {e}")
+        return None, []
     
-    def search_github_files(self, repo: str, pattern: str = "*.yaml,*.yml,*.txt") -> List[str]:
-        """搜索 GitHub 仓库中的文件"""
-        try:
-            api_url = f"https://api.github.com/repos/{repo}/git/trees/main?recursive=1"
-            response = self.session.get(api_url, timeout=10)
-            
+    @staticmethod
+    def is_excluded(path: str) -> bool:
+        """路径中某一级目录/文件名，或其中以非字母数字分隔的单词命中排除关键字"""
+        lower = path.lower()
+        words = set(lower.split('/')) | set(re.split(r'[^a-z0-9]+', lower))
+        return any(keyword in words for keyword in CRAWL_EXCLUDE_KEYWORDS)
+    
+    @staticmethod
+    def select_candidate_files(blobs: List[Dict]) -> List[Dict]:
+        """按大小和文件名筛选候选文件，关键字命中的文件排在前面"""
+        candidates = []
+        for item in blobs:
+            path = item['path']
+            lower = path.lower()
+            if not any(lower.endswith(ext) for ext in CRAWL_FILE_EXTENSIONS):
+                continue
+            if GitHubNodeCrawler.is_excluded(path):
+                continue
+            size = item.get('size', 0)
+            if size < CRAWL_MIN_FILE_SIZE or size > CRAWL_MAX_FILE_SIZE:
+                continue
+            candidates.append(item)
+        
+        def score(item: Dict) -> int:
+            name = item['path'].lower().rsplit('/', 1)[-1]
+            return sum(1 for keyword in CRAWL_NAME_KEYWORDS if keyword in name)
+        
+        candidates.sort(key=lambda item: (-score(item), item['path']))
+        return candidates
+    
+    def iter_raw_file_text(self, repo: str, branch: str, file_path: str) -> Iterator[str]:
+        """从 raw 地址流式下载文件，并增量解码为 UTF-8 文本块"""
+        raw_url = f"{GITHUB_RAW_URL}/{repo}/{branch}/{file_path}"
+        with self.session.get(raw_url, timeout=10, stream=True) as response:
             if response.status_code != 200:
-                # 尝试 master 分支
-                api_url = f"https://api.github.com/repos/{repo}/git/trees/master?recursive=1"
-                response = self.session.get(api_url, timeout=10)
+                return
             
-            if response.status_code == 200:
-                data = response.json()
-                files = []
-                for item in data.get('tree', []):
-                    if item['type'] == 'blob':
-                        path = item['path']
-                        if any(path.endswith(ext) for ext in ['.yaml', '.yml', '.txt', '.json']):
-                            files.append(path)
-                return files
-            return []
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            received = 0
+            for chunk in response.iter_content(chunk_size=CRAWL_CHUNK_SIZE):
+                received += len(chunk)
+                self.fetched_bytes += len(chunk)
+                if received > CRAWL_MAX_FILE_SIZE:
+                    logger.warning(f"文件过大，已截断 {repo}/{file_path}")
+                    break
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+            tail = decoder.decode(b'', final=True)
+            if tail:
+                yield tail
+    
+    def get_raw_file_content(self, repo: str, branch: str, file_path: str) -> str:
+        """通过 raw 地址获取完整文件内容"""
+        try:
+            return ''.join(self.iter_raw_file_text(repo, branch, file_path))
         except Exception as e:
-            logger.error(f"搜索文件失败 {repo}: {e}")
-            return []
+            logger.error(f"获取文件内容失败 {repo}/{file_path}: {e}")
+            return ""
     
-    def parse_clash_config(self, content: str) -> List[Dict]:
+    @staticmethod
+    def parse_clash_config(content: str) -> List[Dict]:
         """解析 Clash 配置文件"""
         nodes = []
         try:
@@ -82,7 +182,8 @@ class GitHubNodeCrawler:
         
         return nodes
     
-    def parse_ss_ssr_v2ray(self, content: str) -> List[Dict]:
+    @staticmethod
+    def parse_ss_ssr_v2ray(content: str) -> List[Dict]:
         """解析 SS/SSR/V2Ray 链接"""
         nodes = []
         
@@ -182,61 +283,143 @@ class GitHubNodeCrawler:
         
         return nodes
     
-    def crawl_repo(self, repo: str) -> List[Dict]:
-        """爬取指定仓库的所有节点"""
+    @classmethod
+    def parse_stream(cls, path: str, chunks: Iterator[str]) -> List[Dict]:
+        """边下载边解析：完整的行立即交给链接解析器，YAML/JSON 文件另外整体解析"""
+        nodes = []
+        is_config = path.lower().endswith(('.yaml', '.yml', '.json'))
+        parts = []
+        pending = ''
+        
+        for text in chunks:
+            if is_config:
+                parts.append(text)
+            pending += text
+            cut = pending.rfind('\n')
+            if cut >= 0:
+                nodes.extend(cls.parse_ss_ssr_v2ray(pending[:cut + 1]))
+                pending = pending[cut + 1:]
+        if pending:
+            nodes.extend(cls.parse_ss_ssr_v2ray(pending))
+        
+        if is_config and parts:
+            nodes.extend(cls.parse_clash_config(''.join(parts)))
+        
+        return nodes
+    
+    def start_parse_pool(self):
+        """启动解析进程池，大小默认与 CPU 核数一致
+        
+        使用 spawn 启动子进程：主进程中有日志队列线程（守护模式下还有事件循环），
+        fork 可能复制到被其他线程持有的锁，导致子进程在首次写日志时卡死。
+        """
+        if self.parse_pool is None:
+            workers = PARSE_WORKERS or os.cpu_count() or 1
+            self.parse_pool = ProcessPoolExecutor(max_workers=workers,
+                                                  mp_context=multiprocessing.get_context('spawn'),
+                                                  initializer=init_parse_worker)
+            logger.info(f"解析进程池已启动，共 {workers} 个进程")
+    
+    def stop_parse_pool(self):
+        """关闭解析进程池"""
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown(wait=True)
+            self.parse_pool = None
+    
+    def crawl_repo(self, repo: str, budget: Optional[int] = None) -> List[Dict]:
+        """爬取指定仓库的所有节点，budget 限制本次抓取的文件数"""
         all_nodes = []
         logger.info(f"开始爬取仓库: {repo}")
+        repo_start_bytes = self.fetched_bytes
         
-        # 搜索可能的配置文件
-        files = self.search_github_files(repo)
+        # 一次文件树请求，之后全部走 raw 地址，不占用 API 配额
+        branch, blobs = self.list_repo_tree(repo)
+        if branch:
+            candidates = self.select_candidate_files(blobs)
+            branches = [branch]
+        else:
+            # 文件树不可用时，尝试直接访问常见的配置文件路径
+            candidates = [{'path': path, 'size': 0} for path in [
+                "clash.yaml", "clash.yml", "config.yaml", "config.yml",
+                "proxies.yaml", "proxies.yml", "sub.yaml", "sub.yml",
+                "nodes.txt", "free.txt", "proxy.txt"
+            ]]
+            branches = CRAWL_BRANCHES
         
-        # 也尝试直接访问常见的配置文件路径
-        common_paths = [
-            "clash.yaml", "clash.yml", "config.yaml", "config.yml",
-            "proxies.yaml", "proxies.yml", "sub.yaml", "sub.yml",
-            "nodes.txt", "free.txt", "proxy.txt"
-        ]
+        if self.stats is not None:
+            candidates = self.stats.order_files(repo, candidates)
+        if budget is not None and len(candidates) > budget:
+            logger.info(f"仓库 {repo} 共 {len(candidates)} 个候选文件，本次按预算抓取 {budget} 个")
+            candidates = candidates[:budget]
+        else:
+            logger.info(f"仓库 {repo} 共 {len(candidates)} 个候选文件")
         
-        for path in common_paths + files[:10]:  # 限制文件数量
-            try:
-                content = self.get_github_file_content(repo, path)
+        def collect(path: str, nodes: List[Dict], fetched: int):
+            # 进程池解析的结果已压缩过，这里统一压缩，保证两条路径统计的产出一致
+            nodes = compact_nodes(nodes)
+            for node in nodes:
+                node['source_repo'] = repo
+                node['source_file'] = path
+            if nodes:
+                all_nodes.extend(nodes)
+                logger.info(f"从 {path} 解析到 {len(nodes)} 个节点")
+            if self.stats is not None and fetched:
+                self.stats.record_file(repo, path, len(nodes), fetched)
+        
+        # 大文件交给解析进程池，主线程继续下载后续文件
+        pending: List[Tuple[str, int, Future]] = []
+        for item in candidates:
+            path = item['path']
+            start_bytes = self.fetched_bytes
+            if self.parse_pool is not None and item['size'] >= PARSE_POOL_MIN_SIZE:
+                content = self.get_raw_file_content(repo, branches[0], path)
                 if content:
-                    # 尝试解析 Clash 配置
-                    nodes = self.parse_clash_config(content)
-                    if nodes:
-                        all_nodes.extend(nodes)
-                        logger.info(f"从 {path} 解析到 {len(nodes)} 个节点")
-                    
-                    # 尝试解析 SS/SSR/V2Ray 链接
-                    nodes = self.parse_ss_ssr_v2ray(content)
+                    future = self.parse_pool.submit(parse_file_content, path, content)
+                    pending.append((path, self.fetched_bytes - start_bytes, future))
+                continue
+            
+            nodes = []
+            for candidate_branch in branches:
+                try:
+                    nodes = self.parse_stream(path, self.iter_raw_file_text(repo, candidate_branch, path))
                     if nodes:
-                        all_nodes.extend(nodes)
-                        logger.info(f"从 {path} 解析到 {len(nodes)} 个链接节点")
+                        break
+                except Exception as e:
+                    logger.debug(f"处理文件 {path} 失败: {e}")
+            collect(path, nodes, self.fetched_bytes - start_bytes)
+        
+        for path, fetched, future in pending:
+            try:
+                nodes, messages = future.result()
             except Exception as e:
                 logger.debug(f"处理文件 {path} 失败: {e}")
+                continue
+            for level, message in messages:
+                logger.log(level, f"{message}（{repo}/{path}）")
+            collect(path, nodes, fetched)
         
+        if self.stats is not None:
+            self.stats.record_repo(repo, len(all_nodes), self.fetched_bytes - repo_start_bytes)
         logger.info(f"仓库 {repo} 共爬取到 {len(all_nodes)} 个节点")
         return all_nodes
     
     def crawl_all(self, repos: List[str]) -> List[Dict]:
         """爬取所有仓库"""
         all_nodes = []
-        for repo in repos:
-            try:
-                nodes = self.crawl_repo(repo)
-                all_nodes.extend(nodes)
-            except Exception as e:
-                logger.error(f"爬取仓库 {repo} 失败: {e}")
+        budgets = {repo: None for repo in repos} if self.stats is None else self.stats.plan(repos)
+        self.start_parse_pool()
+        try:
+            for repo, budget in budgets.items():
+                try:
+                    nodes = self.crawl_repo(repo, budget)
+                    all_nodes.extend(nodes)
+                except Exception as e:
+                    logger.error(f"爬取仓库 {repo} 失败: {e}")
+        finally:
+            self.stop_parse_pool()
         
         # 去重
-        unique_nodes = []
-        seen = set()
-        for node in all_nodes:
-            key = f"{node.get('server', '')}:{node.get('port', '')}"
-            if key not in seen:
-                seen.add(key)
-                unique_nodes.append(node)
+        unique_nodes = compact_nodes(all_nodes)
         
         logger.info(f"去重后共 {len(unique_nodes)} 个唯一节点")
         return unique_nodes
-
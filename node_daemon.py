@@ -0,0 +1,213 @@
+"""
+守护进程模块 - 常驻内存，持续爬取、探测并增量发布节点
+"""
+import asyncio
+import heapq
+import logging
+import random
+import time
+from typing import Callable, Dict, List, Optional
+from config import (
+    GITHUB_REPOS, DAEMON_CRAWL_INTERVAL, DAEMON_PROBE_WORKERS, DAEMON_MIN_PROBE_INTERVAL,
+    DAEMON_MAX_PROBE_INTERVAL, DAEMON_PROBE_JITTER, DAEMON_MAX_FAILURES, DAEMON_PUBLISH_DEBOUNCE,
+)
+from node_crawler import GitHubNodeCrawler, node_key
+from node_validator import NodeValidator
+from node_speedtest import NodeSpeedTest
+from node_storage import NodeStorage
+from node_geoip import annotate_nodes
+from source_stats import SourceStats
+
+logger = logging.getLogger(__name__)
+
+
+class NodeMonitorDaemon:
+    """节点监控守护进程
+
+    每个节点按自身稳定性安排探测：结果与上次一致时探测间隔翻倍，
+    状态变化时回落到最小间隔。所有探测由固定数量的工作协程完成。
+    """
+
+    def __init__(self, repos: List[str] = GITHUB_REPOS):
+        self.repos = repos
+        self.stats = SourceStats.load()
+        self.crawler = GitHubNodeCrawler(self.stats)
+        self.validator = NodeValidator()
+        self.speedtest = NodeSpeedTest()
+        # 爬取到的原始节点 / 探测状态 / 当前可用节点
+        self.nodes: Dict[str, Dict] = {}
+        self.states: Dict[str, Dict] = {}
+        self.good: Dict[str, Dict] = {}
+        self.schedule: List = []
+        self.changed = asyncio.Event()
+        self.publishers: List[Callable[[List[Dict]], None]] = []
+
+    def add_publisher(self, publisher: Callable[[List[Dict]], None]):
+        """注册可用节点集合变化时的回调"""
+        self.publishers.append(publisher)
+
+    def good_nodes(self) -> List[Dict]:
+        """当前可用节点，按速度排序"""
+        nodes = list(self.good.values())
+        nodes.sort(key=lambda x: x.get('speed', 0), reverse=True)
+        return nodes
+
+    @staticmethod
+    def jitter(interval: float) -> float:
+        """为探测间隔加入随机抖动，避免探测集中爆发"""
+        return interval * random.uniform(1 - DAEMON_PROBE_JITTER, 1 + DAEMON_PROBE_JITTER)
+
+    def schedule_probe(self, key: str, delay: float):
+        """安排节点在 delay 秒后探测"""
+        due = time.monotonic() + delay
+        self.states[key]['due'] = due
+        heapq.heappush(self.schedule, (due, key))
+
+    def merge_nodes(self, crawled: List[Dict]):
+        """合并新爬取的节点：新节点排入探测队列，消失且不可用的节点移除
+
+        只移除来源仓库本次成功爬到节点、但节点本身已不在其中的节点；
+        爬取失败、仓库处于退避期或整体返回空结果时保留原有候选节点。
+        """
+        crawled_keys = set()
+        crawled_repos = set()
+        added = 0
+        for node in crawled:
+            key = node_key(node)
+            crawled_keys.add(key)
+            crawled_repos.add(node.get('source_repo'))
+            if key not in self.nodes:
+                added += 1
+                self.states[key] = {'interval': DAEMON_MIN_PROBE_INTERVAL, 'failures': 0}
+                # 新节点分散在一个最小间隔内探测
+                self.schedule_probe(key, random.uniform(0, DAEMON_MIN_PROBE_INTERVAL))
+            self.nodes[key] = node
+
+        for key, node in list(self.nodes.items()):
+            if key not in crawled_keys and key not in self.good and node.get('source_repo') in crawled_repos:
+                self.drop_node(key)
+
+        logger.info(f"合并节点完成，新增 {added} 个，当前共 {len(self.nodes)} 个节点")
+
+    def restore_published(self):
+        """载入上次发布的节点作为初始可用集合并排入探测队列
+
+        否则启动后第一次发布只包含最先探测完的少量节点，会覆盖完整的输出文件。
+        """
+        restored = 0
+        for node in NodeStorage.load_from_json():
+            key = node_key(node)
+            if key in self.nodes:
+                continue
+            self.nodes[key] = node
+            self.good[key] = node
+            self.states[key] = {'interval': DAEMON_MIN_PROBE_INTERVAL, 'failures': 0}
+            self.schedule_probe(key, random.uniform(0, DAEMON_MIN_PROBE_INTERVAL))
+            restored += 1
+        logger.info(f"已载入上次发布的 {restored} 个节点")
+
+    def drop_node(self, key: str):
+        """移除节点（调度堆中的过期条目在出堆时忽略）"""
+        self.nodes.pop(key, None)
+        self.states.pop(key, None)
+        if self.good.pop(key, None) is not None:
+            self.changed.set()
+
+    async def probe(self, key: str):
+        """探测单个节点并更新其调度间隔"""
+        node = self.nodes.get(key)
+        state = self.states.get(key)
+        if node is None or state is None:
+            return
+
+        result = await self.validator.validate_node(dict(node))
+        if result is not None:
+            result = await self.speedtest.test_node_speed(result)
+        if self.states.get(key) is not state:
+            # 探测期间节点已被移除（或移除后重新加入），结果作废
+            return
+
+        was_good = key in self.good
+        is_good = result is not None
+        if is_good:
+            self.good[key] = result
+            state['failures'] = 0
+        else:
+            self.good.pop(key, None)
+            state['failures'] += 1
+
+        if is_good == was_good:
+            state['interval'] = min(state['interval'] * 2, DAEMON_MAX_PROBE_INTERVAL)
+        else:
+            state['interval'] = DAEMON_MIN_PROBE_INTERVAL
+            self.changed.set()
+
+        if state['failures'] >= DAEMON_MAX_FAILURES:
+            logger.debug(f"节点 {key} 连续失败 {state['failures']} 次，已移除")
+            self.drop_node(key)
+        else:
+            self.schedule_probe(key, self.jitter(state['interval']))
+
+    async def probe_worker(self):
+        """探测工作协程：取出到期的节点并探测"""
+        while True:
+            if not self.schedule:
+                await asyncio.sleep(1)
+                continue
+
+            due, key = self.schedule[0]
+            wait = due - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(min(wait, 1))
+                continue
+
+            heapq.heappop(self.schedule)
+            state = self.states.get(key)
+            if state is None or state.get('due') != due:
+                continue
+            try:
+                await self.probe(key)
+            except Exception as e:
+                logger.debug(f"探测节点 {key} 失败: {e}")
+
+    async def crawl_loop(self):
+        """按固定周期重新爬取节点源"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                crawled = await loop.run_in_executor(None, self.crawler.crawl_all, self.repos)
+                self.merge_nodes(crawled)
+                await loop.run_in_executor(None, self.stats.save)
+            except Exception as e:
+                logger.error(f"爬取节点源失败: {e}")
+            await asyncio.sleep(DAEMON_CRAWL_INTERVAL)
+
+    async def publish_loop(self):
+        """可用节点集合变化后，延迟合并并增量发布输出"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.changed.wait()
+            await asyncio.sleep(DAEMON_PUBLISH_DEBOUNCE)
+            self.changed.clear()
+
+            nodes = self.good_nodes()
+            annotate_nodes(nodes)
+            # 以当前可用节点作为最近一次爬取的验证结果，更新节点源统计
+            self.stats.record_validated(nodes)
+            await loop.run_in_executor(None, self.stats.save)
+            logger.info(f"可用节点集合已变化，发布 {len(nodes)} 个节点")
+            nodes = await loop.run_in_executor(None, NodeStorage.save_all, nodes)
+            for publisher in self.publishers:
+                try:
+                    publisher(nodes)
+                except Exception as e:
+                    logger.error(f"发布回调失败: {e}")
+
+    async def run(self, extra_tasks: Optional[List] = None):
+        """启动守护进程"""
+        logger.info(f"守护进程启动，探测并发上限 {DAEMON_PROBE_WORKERS}")
+        self.restore_published()
+        tasks = [self.crawl_loop(), self.publish_loop()]
+        tasks += [self.probe_worker() for _ in range(DAEMON_PROBE_WORKERS)]
+        tasks += extra_tasks or []
+        await asyncio.gather(*tasks)
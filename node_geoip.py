@@ -0,0 +1,151 @@
+"""
+离线 IP 归属地模块 - 由 CSV 构建二进制区间表，mmap 后二分查找
+"""
+import array
+import bisect
+import csv
+import logging
+import mmap
+import socket
+import struct
+import sys
+from typing import Dict, List, Optional, Tuple
+from config import GEOIP_CSV, GEOIP_DB
+
+logger = logging.getLogger(__name__)
+
+# 文件头: 魔数(4) + 版本(2) + 字节序(2) + 记录数(4) + 保留(4)，共 16 字节
+MAGIC = b'NGEO'
+VERSION = 1
+HEADER = struct.Struct('<4sHHII')
+BYTEORDER = {'little': 1, 'big': 2}[sys.byteorder]
+
+
+def ip_to_int(ip: str) -> Optional[int]:
+    """IPv4 地址转整数，非 IPv4 返回 None"""
+    try:
+        return int.from_bytes(socket.inet_aton(ip), 'big') if ip.count('.') == 3 else None
+    except OSError:
+        return None
+
+
+def _parse_ip(value: str) -> Optional[int]:
+    """CSV 中的 IP 可以是点分格式，也可以是整数"""
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        return number if number <= 0xFFFFFFFF else None
+    return ip_to_int(value)
+
+
+def build_database(csv_file: str = GEOIP_CSV, db_file: str = GEOIP_DB) -> int:
+    """由 CSV（start_ip,end_ip,country[,asn]）构建二进制区间表，返回记录数
+
+    表按列存放：起始地址、结束地址、ASN 均为 uint32 数组，国家代码为 2 字节数组，
+    查询时起始地址列可直接作为 memoryview 二分查找。仅收录 IPv4 区间。
+    """
+    rows: List[Tuple[int, int, bytes, int]] = []
+    with open(csv_file, 'r', encoding='utf-8', newline='') as f:
+        for record in csv.reader(f):
+            if len(record) < 3:
+                continue
+            start, end = _parse_ip(record[0]), _parse_ip(record[1])
+            if start is None or end is None or end < start:
+                continue
+            country = record[2].strip().upper().encode('ascii', 'ignore')[:2].ljust(2, b'-')
+            asn_text = record[3].strip().upper().lstrip('AS') if len(record) > 3 else ''
+            asn = int(asn_text) if asn_text.isdigit() else 0
+            rows.append((start, end, country, asn))
+
+    rows.sort()
+    starts = array.array('I', (row[0] for row in rows))
+    ends = array.array('I', (row[1] for row in rows))
+    asns = array.array('I', (row[3] for row in rows))
+    countries = b''.join(row[2] for row in rows)
+
+    with open(db_file, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, BYTEORDER, len(rows), 0))
+        starts.tofile(f)
+        ends.tofile(f)
+        asns.tofile(f)
+        f.write(countries)
+
+    logger.info(f"已由 {csv_file} 构建 {len(rows)} 条 IP 区间到 {db_file}")
+    return len(rows)
+
+
+class GeoIPLookup:
+    """基于 mmap 的 IP 区间查询，不把表加载为 Python 对象"""
+
+    def __init__(self, db_file: str = GEOIP_DB):
+        with open(db_file, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, byteorder, count, _ = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION or byteorder != BYTEORDER:
+            self.mm.close()
+            raise ValueError(f"IP 库格式不兼容，请重新构建: {db_file}")
+
+        view = memoryview(self.mm)
+        offset = HEADER.size
+        width = count * 4
+        self.count = count
+        self.starts = view[offset:offset + width].cast('I')
+        self.ends = view[offset + width:offset + 2 * width].cast('I')
+        self.asns = view[offset + 2 * width:offset + 3 * width].cast('I')
+        self.countries = view[offset + 3 * width:offset + 3 * width + 2 * count].cast('H')
+        # 国家代码种类很少，解码结果按原始值缓存
+        self.country_names: Dict[int, str] = {}
+
+    def lookup(self, ip: str) -> Optional[Tuple[str, int]]:
+        """查询 IP 归属，返回 (国家代码, ASN)，未命中返回 None"""
+        number = ip_to_int(ip)
+        if number is None:
+            return None
+        position = bisect.bisect_right(self.starts, number) - 1
+        if position < 0 or number > self.ends[position]:
+            return None
+        code = self.countries[position]
+        country = self.country_names.get(code)
+        if country is None:
+            country = self.country_names[code] = code.to_bytes(2, sys.byteorder).decode('ascii')
+        return country, self.asns[position]
+
+    def annotate(self, nodes: List[Dict]) -> int:
+        """为节点补充 country/asn 字段，返回命中数
+
+        只处理 server（或已解析的 ip 字段）为 IPv4 地址的节点，不做 DNS 解析。
+        """
+        hits = 0
+        for node in nodes:
+            result = self.lookup(str(node.get('ip') or node.get('server', '')))
+            if result is not None:
+                node['country'], node['asn'] = result
+                hits += 1
+        return hits
+
+
+_lookup: Optional[GeoIPLookup] = None
+
+
+def annotate_nodes(nodes: List[Dict], db_file: str = GEOIP_DB) -> int:
+    """使用本地 IP 库为节点标注地区；IP 库不存在时直接跳过"""
+    global _lookup
+    if _lookup is None:
+        try:
+            _lookup = GeoIPLookup(db_file)
+        except FileNotFoundError:
+            logger.debug(f"未找到 IP 库 {db_file}，跳过地区标注")
+            return 0
+        except Exception as e:
+            logger.error(f"加载 IP 库失败: {e}")
+            return 0
+
+    hits = _lookup.annotate(nodes)
+    logger.info(f"地区标注完成，{hits}/{len(nodes)} 个节点命中")
+    return hits
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    build_database(*sys.argv[1:3])
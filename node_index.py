@@ -0,0 +1,227 @@
+"""
+节点索引模块 - 内存二级索引与磁盘快照
+"""
+import array
+import heapq
+import logging
+import math
+import os
+import pickle
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Union
+from config import OUTPUT_NODES_INDEX, INDEX_SPEED_BUCKET, INDEX_RTT_BUCKET
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 2
+
+Values = Union[str, int, Iterable]
+
+# 按数值范围查询的字段：字段 -> 桶宽
+RANGE_FIELDS = {'speed': INDEX_SPEED_BUCKET, 'rtt': INDEX_RTT_BUCKET}
+
+
+class LazyNodes:
+    """快照中的节点按需反序列化：加载快照时只读入字节串，查询结果用到的节点才解码"""
+
+    def __init__(self, blobs: List[bytes]):
+        self.blobs = blobs
+        self.cache: List[Optional[Dict]] = [None] * len(blobs)
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def __getitem__(self, position: int) -> Dict:
+        node = self.cache[position]
+        if node is None:
+            node = self.cache[position] = pickle.loads(self.blobs[position])
+        return node
+
+    def __iter__(self) -> Iterator[Dict]:
+        for position in range(len(self.cache)):
+            yield self[position]
+
+    def append(self, node: Dict):
+        self.blobs.append(b'')
+        self.cache.append(node)
+
+
+class NodeIndex:
+    """节点索引
+
+    节点按列表下标存放，每个字段维护 值 -> 下标集合 的倒排表。
+    速度和延迟按桶建立索引：范围条件单独查询时只需精确检查边界桶，
+    与其他条件组合时直接在交集结果上比较数值（数值另存为数组，比较时不访问节点）。
+    """
+
+    FIELDS = ('protocol', 'port', 'country', 'site', 'speed', 'rtt')
+
+    def __init__(self, nodes: Optional[List[Dict]] = None):
+        self.nodes: Union[List[Dict], LazyNodes] = []
+        self.indexes: Dict[str, Dict] = {field: {} for field in self.FIELDS}
+        # 范围字段的数值列，缺失为 NaN
+        self.values: Dict[str, array.array] = {field: array.array('d') for field in RANGE_FIELDS}
+        for node in nodes or []:
+            self.add(node)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def _post(self, field: str, value, position: int):
+        self.indexes[field].setdefault(value, set()).add(position)
+
+    def add(self, node: Dict):
+        """加入一个节点并更新所有索引"""
+        position = len(self.nodes)
+        self.nodes.append(node)
+
+        self._post('protocol', str(node.get('type', '')).lower(), position)
+        try:
+            self._post('port', int(node.get('port', 0)), position)
+        except (TypeError, ValueError):
+            pass
+        if node.get('country'):
+            self._post('country', str(node['country']).lower(), position)
+        for site, accessible in node.get('streaming_access', {}).items():
+            if accessible:
+                self._post('site', site, position)
+        for field, bucket_size in RANGE_FIELDS.items():
+            value = node.get(field)
+            if value is None:
+                self.values[field].append(math.nan)
+            else:
+                self.values[field].append(float(value))
+                self._post(field, int(value // bucket_size), position)
+
+    @staticmethod
+    def _values(value: Values) -> List:
+        if isinstance(value, (str, int)):
+            return [value]
+        return list(value)
+
+    def _match_any(self, field: str, values: Values) -> Set[int]:
+        """字段取值为 values 中任意一个的节点下标"""
+        table = self.indexes[field]
+        result: Set[int] = set()
+        for value in self._values(values):
+            if isinstance(value, str):
+                value = value.lower()
+            result |= table.get(value, set())
+        return result
+
+    @staticmethod
+    def _in_range(value: float, low: Optional[float], high: Optional[float]) -> bool:
+        # NaN（缺失）与任何数比较都为 False，上下界都不设时也不匹配
+        if value != value:
+            return False
+        return (low is None or value >= low) and (high is None or value <= high)
+
+    def _match_range(self, field: str, bucket_size: float, low: Optional[float] = None,
+                     high: Optional[float] = None) -> Set[int]:
+        """数值字段落在 [low, high] 内的节点下标"""
+        result: Set[int] = set()
+        values = self.values[field]
+        low_bucket = None if low is None else int(low // bucket_size)
+        high_bucket = None if high is None else int(high // bucket_size)
+        for bucket, positions in self.indexes[field].items():
+            if low_bucket is not None and bucket < low_bucket:
+                continue
+            if high_bucket is not None and bucket > high_bucket:
+                continue
+            if bucket == low_bucket or bucket == high_bucket:
+                # 边界桶逐个检查
+                for position in positions:
+                    if self._in_range(values[position], low, high):
+                        result.add(position)
+            else:
+                result |= positions
+        return result
+
+    def query(self, protocol: Optional[Values] = None, port: Optional[Values] = None,
+              country: Optional[Values] = None, site: Optional[Values] = None,
+              min_speed: Optional[float] = None, max_speed: Optional[float] = None,
+              max_rtt: Optional[float] = None, limit: Optional[int] = None) -> List[Dict]:
+        """按条件查询节点，保持原有顺序
+
+        protocol/port/country 传入多个值时满足其一即可，site 传入多个值时需全部可访问。
+        """
+        candidates: List[Set[int]] = []
+        if protocol is not None:
+            candidates.append(self._match_any('protocol', protocol))
+        if port is not None:
+            candidates.append(self._match_any('port', port))
+        if country is not None:
+            candidates.append(self._match_any('country', country))
+        if site is not None:
+            for name in self._values(site):
+                candidates.append(self.indexes['site'].get(name, set()))
+
+        ranges = []
+        if min_speed is not None or max_speed is not None:
+            ranges.append(('speed', RANGE_FIELDS['speed'], min_speed, max_speed))
+        if max_rtt is not None:
+            ranges.append(('rtt', RANGE_FIELDS['rtt'], None, max_rtt))
+
+        if not candidates and ranges:
+            # 只有范围条件时才展开数值桶，其余范围条件在结果上逐个检查
+            candidates.append(self._match_range(*ranges.pop(0)))
+
+        if not candidates:
+            positions = range(len(self.nodes))
+        else:
+            # 从最小的集合开始求交集
+            candidates.sort(key=len)
+            matched = candidates[0].intersection(*candidates[1:])
+            for field, _, low, high in ranges:
+                values = self.values[field]
+                matched = {position for position in matched if self._in_range(values[position], low, high)}
+            # 只要前 limit 个时不必对整个交集排序
+            if limit is not None and limit < len(matched):
+                positions = heapq.nsmallest(limit, matched)
+            else:
+                positions = sorted(matched)
+
+        if limit is not None:
+            positions = positions[:limit]
+        return [self.nodes[position] for position in positions]
+
+    def save(self, filename: str = OUTPUT_NODES_INDEX):
+        """写入磁盘快照（先写临时文件再替换，避免读到半个文件）
+
+        每个节点单独序列化为字节串，加载时不必解码全部节点；桶宽一并写入，
+        配置中的桶宽改变后旧快照作废。
+        """
+        blobs = [pickle.dumps(node, protocol=pickle.HIGHEST_PROTOCOL) for node in self.nodes]
+        data = {
+            'version': SNAPSHOT_VERSION,
+            'buckets': dict(RANGE_FIELDS),
+            'nodes': blobs,
+            'indexes': self.indexes,
+            'values': {field: values.tobytes() for field, values in self.values.items()},
+        }
+        tmp = f"{filename}.tmp"
+        with open(tmp, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, filename)
+
+    @classmethod
+    def load(cls, filename: str = OUTPUT_NODES_INDEX) -> Optional['NodeIndex']:
+        """读取磁盘快照，不存在、版本或桶宽不符时返回 None"""
+        try:
+            with open(filename, 'rb') as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"读取索引快照失败: {e}")
+            return None
+
+        if data.get('version') != SNAPSHOT_VERSION or data.get('buckets') != RANGE_FIELDS:
+            logger.info(f"索引快照 {filename} 版本或桶宽与当前配置不符，需要重建")
+            return None
+        index = cls()
+        index.nodes = LazyNodes(data['nodes'])
+        index.indexes = data['indexes']
+        for field, raw in data['values'].items():
+            index.values[field] = array.array('d')
+            index.values[field].frombytes(raw)
+        return index
@@ -6,9 +6,15 @@ import aiohttp
 import time
 import logging
 import random
-from typing import List, Dict, Optional
-from config import SPEED_TEST_URL, MIN_SPEED, MAX_SPEED, TEST_TIMEOUT, MAX_CONCURRENT
+import statistics
+from typing import Callable, List, Dict, Optional
+from config import (
+    SPEED_TEST_URL, MIN_SPEED, MAX_SPEED, TEST_TIMEOUT, MAX_CONCURRENT, SPEED_TEST_MODE,
+    THROUGHPUT_URL, THROUGHPUT_WINDOW, THROUGHPUT_SAMPLE_INTERVAL, THROUGHPUT_STREAMS,
+    THROUGHPUT_WARMUP_TIMEOUT, THROUGHPUT_MAX_SPEED,
+)
 from proxy_helper import ProxyHelper
+from log_setup import NODE_EVENT
 
 logger = logging.getLogger(__name__)
 
@@ -70,8 +76,86 @@ class NodeSpeedTest:
                 return random.uniform(MIN_SPEED, MAX_SPEED)
             return None
     
+    async def measure_throughput(self, node: Dict, streams: int = THROUGHPUT_STREAMS,
+                                 window: float = THROUGHPUT_WINDOW, url: str = THROUGHPUT_URL,
+                                 proxy: Optional[str] = None) -> Optional[float]:
+        """测量持续带宽（KB/s）
+        
+        先通过代理建立并预热 keep-alive 连接，再在固定时间窗口内用 streams 条并行流持续下载，
+        按 THROUGHPUT_SAMPLE_INTERVAL 采样，丢弃第一个采样（慢启动阶段）后取中位数。
+        proxy 为空时由节点构建；无法构建代理 URL 的协议（vmess/vless/trojan/ssr 等）返回 None，不做直连测量。
+        """
+        proxy = proxy or self.proxy_helper.build_proxy_url(node)
+        if not proxy:
+            logger.debug(f"节点 {node.get('server', '')} 无法构建代理，跳过带宽测试")
+            return None
+        loop = asyncio.get_running_loop()
+        connector = aiohttp.TCPConnector(limit=streams)
+        timeout = aiohttp.ClientTimeout(total=THROUGHPUT_WARMUP_TIMEOUT + window + TEST_TIMEOUT)
+        
+        async with self.semaphore:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                # 预热：每条流先完成一次小请求，连接留在连接池中复用
+                async def warm_up():
+                    async with session.get(url, proxy=proxy, headers={'Range': 'bytes=0-1023'},
+                                           timeout=aiohttp.ClientTimeout(total=THROUGHPUT_WARMUP_TIMEOUT)) as response:
+                        if response.status == 206:
+                            await response.read()
+                        else:
+                            # 服务器忽略 Range 时会返回完整的大文件，只读取开头部分，不在预热阶段下载整个文件
+                            await response.content.read(1024)
+                        return response.status in (200, 206)
+                
+                try:
+                    warmed = await asyncio.gather(*[warm_up() for _ in range(streams)])
+                except Exception as e:
+                    logger.debug(f"预热连接失败 {node.get('server', '')}: {e}")
+                    return None
+                if not any(warmed):
+                    return None
+                
+                received = 0
+                deadline = loop.time() + window
+                
+                async def download():
+                    nonlocal received
+                    while loop.time() < deadline:
+                        async with session.get(url, proxy=proxy) as response:
+                            if response.status != 200:
+                                return
+                            async for chunk in response.content.iter_chunked(64 * 1024):
+                                received += len(chunk)
+                                if loop.time() >= deadline:
+                                    return
+                
+                async def sample(samples: List[float]):
+                    last, last_time = received, loop.time()
+                    while loop.time() < deadline:
+                        await asyncio.sleep(THROUGHPUT_SAMPLE_INTERVAL)
+                        # 按实际经过的时间计算，事件循环繁忙时 sleep 可能明显超过采样间隔
+                        now = loop.time()
+                        samples.append((received - last) / 1024 / (now - last_time))
+                        last, last_time = received, now
+                
+                samples: List[float] = []
+                tasks = [asyncio.ensure_future(download()) for _ in range(streams)]
+                try:
+                    await sample(samples)
+                finally:
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+        
+        if len(samples) > 1:
+            samples = samples[1:]
+        if not samples or received == 0:
+            return None
+        return statistics.median(samples)
+    
     async def test_node_speed(self, node: Dict) -> Optional[Dict]:
         """测试单个节点速度"""
+        if SPEED_TEST_MODE == 'throughput':
+            return await self.test_node_throughput(node)
         try:
             speed = await self.test_speed(node)
             
@@ -80,7 +164,7 @@ class NodeSpeedTest:
                 if MIN_SPEED <= speed <= MAX_SPEED:
                     node['speed'] = round(speed, 2)
                     node['speed_ok'] = True
-                    logger.info(f"节点 {node.get('server', '')} 速度: {speed:.2f} KB/s")
+                    logger.info(f"节点 {node.get('server', '')} 速度: {speed:.2f} KB/s", extra=NODE_EVENT)
                     return node
                 else:
                     logger.debug(f"节点 {node.get('server', '')} 速度 {speed:.2f} KB/s 不在范围内")
@@ -91,18 +175,45 @@ class NodeSpeedTest:
                     speed = random.uniform(MIN_SPEED, MAX_SPEED)
                     node['speed'] = round(speed, 2)
                     node['speed_ok'] = True
-                    logger.info(f"节点 {node.get('server', '')} 使用默认速度: {speed:.2f} KB/s")
+                    logger.info(f"节点 {node.get('server', '')} 使用默认速度: {speed:.2f} KB/s", extra=NODE_EVENT)
                     return node
                 return None
         except Exception as e:
             logger.debug(f"测速异常: {e}")
             return None
     
-    async def test_nodes_speed(self, nodes: List[Dict]) -> List[Dict]:
-        """批量测试节点速度"""
+    async def test_node_throughput(self, node: Dict) -> Optional[Dict]:
+        """持续带宽模式：只采用实测结果，不使用估算值"""
+        try:
+            speed = await self.measure_throughput(node)
+        except Exception as e:
+            logger.debug(f"带宽测试失败 {node.get('server', '')}: {e}")
+            return None
+        
+        if speed is None or speed < MIN_SPEED:
+            return None
+        if THROUGHPUT_MAX_SPEED and speed > THROUGHPUT_MAX_SPEED:
+            logger.debug(f"节点 {node.get('server', '')} 持续带宽 {speed:.2f} KB/s 超过上限")
+            return None
+        
+        node['speed'] = round(speed, 2)
+        node['speed_ok'] = True
+        node['speed_streams'] = THROUGHPUT_STREAMS
+        logger.info(f"节点 {node.get('server', '')} 持续带宽: {speed:.2f} KB/s", extra=NODE_EVENT)
+        return node
+    
+    async def test_nodes_speed(self, nodes: List[Dict],
+                               on_result: Optional[Callable[[Dict, Optional[Dict]], None]] = None) -> List[Dict]:
+        """批量测试节点速度，on_result 在每个节点测速完成后调用（用于写检查点）"""
         logger.info(f"开始测速 {len(nodes)} 个节点...")
         
-        tasks = [self.test_node_speed(node) for node in nodes]
+        async def run(node: Dict) -> Optional[Dict]:
+            result = await self.test_node_speed(node)
+            if on_result is not None:
+                on_result(node, result)
+            return result
+        
+        tasks = [run(node) for node in nodes]
         results = await asyncio.gather(*tasks, return_exceptions=True)
         
         speed_ok_nodes = []
@@ -2,40 +2,107 @@
 节点存储模块
 """
 import json
-import yaml
+import os
 import logging
+from datetime import datetime
 from typing import List, Dict
-from config import OUTPUT_NODES_TXT, OUTPUT_NODES_JSON
+from config import (
+    OUTPUT_NODES_TXT, OUTPUT_NODES_JSON, OUTPUT_NODES_INDEX, SPEED_TEST_URL, REGION_TEST_INTERVAL,
+    OUTPUT_CHANGES, CHANGE_FEED_MAX, CHANGE_SPEED_DELTA, CHANGE_RTT_DELTA,
+)
+from node_index import NodeIndex
 
 logger = logging.getLogger(__name__)
 
+# 指标字段变化记为 changed；连接参数字段变化时附带完整节点
+METRIC_FIELDS = ('speed', 'rtt', 'streaming_access', 'country')
+CONFIG_FIELDS = ('type', 'raw', 'config', 'method', 'password', 'uuid')
+
 
 class NodeStorage:
     """节点存储"""
     
+    @staticmethod
+    def render_txt(nodes: List[Dict]) -> str:
+        """渲染文本格式（链接格式）"""
+        lines = ["# 免费节点列表 - 自动更新\n", "# 来源: GitHub 自动爬取\n\n"]
+        for node in nodes:
+            if 'raw' in node:
+                lines.append(f"{node['raw']}\n")
+            elif node.get('type') == 'ss':
+                # 生成 SS 链接
+                server = node.get('server', '')
+                port = node.get('port', '')
+                method = node.get('method', '')
+                password = node.get('password', '')
+                if server and port:
+                    lines.append(f"# {node.get('name', server)}\n")
+                    lines.append(f"ss://{method}:{password}@{server}:{port}\n")
+        return ''.join(lines)
+    
+    @staticmethod
+    def render_json(nodes: List[Dict]) -> str:
+        """渲染 JSON 格式"""
+        return json.dumps(nodes, ensure_ascii=False, indent=2)
+    
+    @staticmethod
+    def render_clash_yaml(nodes: List[Dict]) -> str:
+        """渲染 Clash YAML 格式"""
+        import yaml
+        proxies = []
+        regions: Dict[str, List[str]] = {}
+        for node in nodes:
+            if 'config' in node and isinstance(node['config'], dict):
+                proxy = node['config'].copy()
+                # 添加速度信息
+                if 'speed' in node:
+                    proxy['speed'] = node['speed']
+                proxies.append(proxy)
+                if node.get('country'):
+                    regions.setdefault(node['country'], []).append(proxy.get('name', ''))
+        
+        # 按地区生成 url-test 分组（需要先用 IP 库标注地区）
+        region_groups = [
+            {
+                'name': f"{country} 自动测速",
+                'type': 'url-test',
+                'url': SPEED_TEST_URL,
+                'interval': REGION_TEST_INTERVAL,
+                'proxies': names
+            }
+            for country, names in sorted(regions.items())
+        ]
+        
+        config = {
+            'port': 7890,
+            'socks-port': 7891,
+            'allow-lan': False,
+            'mode': 'rule',
+            'log-level': 'info',
+            'external-controller': '127.0.0.1:9090',
+            'proxies': proxies,
+            'proxy-groups': [
+                {
+                    'name': '自动选择',
+                    'type': 'select',
+                    'proxies': [g['name'] for g in region_groups] + [p.get('name', '') for p in proxies]
+                }
+            ] + region_groups,
+            'rules': [
+                'DOMAIN-SUFFIX,local,DIRECT',
+                'IP-CIDR,127.0.0.0/8,DIRECT',
+                'GEOIP,CN,DIRECT',
+                'MATCH,自动选择'
+            ]
+        }
+        return yaml.dump(config, allow_unicode=True, default_flow_style=False)
+    
     @staticmethod
     def save_to_txt(nodes: List[Dict], filename: str = OUTPUT_NODES_TXT):
         """保存为文本格式（Clash 格式）"""
         try:
             with open(filename, 'w', encoding='utf-8') as f:
-                f.write("# 免费节点列表 - 自动更新\n")
-                f.write("# 来源: GitHub 自动爬取\n\n")
-                
-                for node in nodes:
-                    if 'raw' in node:
-                        f.write(f"{node['raw']}\n")
-                    elif node.get('type') == 'ss':
-                        # 生成 SS 链接
-                        server = node.get('server', '')
-                        port = node.get('port', '')
-                        method = node.get('method', '')
-                        password = node.get('password', '')
-                        if server and port:
-                            f.write(f"# {node.get('name', server)}\n")
-                            f.write(f"ss://{method}:{password}@{server}:{port}\n")
-                    elif node.get('type') == 'vmess':
-                        if 'raw' in node:
-                            f.write(f"{node['raw']}\n")
+                f.write(NodeStorage.render_txt(nodes))
             
             logger.info(f"已保存 {len(nodes)} 个节点到 {filename}")
         except Exception as e:
@@ -46,7 +113,7 @@ class NodeStorage:
         """保存为 JSON 格式"""
         try:
             with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(nodes, f, ensure_ascii=False, indent=2)
+                f.write(NodeStorage.render_json(nodes))
             logger.info(f"已保存 {len(nodes)} 个节点到 {filename}")
         except Exception as e:
             logger.error(f"保存 JSON 文件失败: {e}")
@@ -55,49 +122,162 @@ class NodeStorage:
     def save_to_clash_yaml(nodes: List[Dict], filename: str = "clash_config.yaml"):
         """保存为 Clash YAML 格式"""
         try:
-            proxies = []
-            for node in nodes:
-                if 'config' in node and isinstance(node['config'], dict):
-                    proxy = node['config'].copy()
-                    # 添加速度信息
-                    if 'speed' in node:
-                        proxy['speed'] = node['speed']
-                    proxies.append(proxy)
-            
-            config = {
-                'port': 7890,
-                'socks-port': 7891,
-                'allow-lan': False,
-                'mode': 'rule',
-                'log-level': 'info',
-                'external-controller': '127.0.0.1:9090',
-                'proxies': proxies,
-                'proxy-groups': [
-                    {
-                        'name': '自动选择',
-                        'type': 'select',
-                        'proxies': [p.get('name', '') for p in proxies]
-                    }
-                ],
-                'rules': [
-                    'DOMAIN-SUFFIX,local,DIRECT',
-                    'IP-CIDR,127.0.0.0/8,DIRECT',
-                    'GEOIP,CN,DIRECT',
-                    'MATCH,自动选择'
-                ]
-            }
-            
             with open(filename, 'w', encoding='utf-8') as f:
-                yaml.dump(config, f, allow_unicode=True, default_flow_style=False)
+                f.write(NodeStorage.render_clash_yaml(nodes))
             
             logger.info(f"已保存 Clash 配置到 {filename}")
         except Exception as e:
             logger.error(f"保存 Clash 配置失败: {e}")
     
     @staticmethod
-    def save_all(nodes: List[Dict]):
-        """保存所有格式"""
+    def save_index(nodes: List[Dict], filename: str = OUTPUT_NODES_INDEX):
+        """保存节点索引快照，供查询接口和订阅服务快速加载"""
+        try:
+            NodeIndex(nodes).save(filename)
+            logger.info(f"已保存 {len(nodes)} 个节点的索引到 {filename}")
+        except Exception as e:
+            logger.error(f"保存索引快照失败: {e}")
+    
+    @staticmethod
+    def load_index(filename: str = OUTPUT_NODES_INDEX, json_filename: str = OUTPUT_NODES_JSON) -> NodeIndex:
+        """读取索引快照；快照不可用或比 nodes.json 旧（例如 nodes.json 由 git 拉取更新）时由 JSON 重建"""
+        try:
+            stale = os.path.getmtime(json_filename) > os.path.getmtime(filename)
+        except OSError:
+            stale = False
+        index = None if stale else NodeIndex.load(filename)
+        if index is None:
+            index = NodeIndex(NodeStorage.load_from_json(json_filename))
+        return index
+    
+    @staticmethod
+    def load_from_json(filename: str = OUTPUT_NODES_JSON) -> List[Dict]:
+        """读取已发布的 JSON 节点列表"""
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            logger.error(f"读取 JSON 文件失败: {e}")
+            return []
+    
+    @staticmethod
+    def node_identity(node: Dict) -> str:
+        """节点身份标识，用于跨次运行比较"""
+        return f"{node.get('server', '')}:{node.get('port', '')}"
+    
+    @staticmethod
+    def metric_changed(field: str, old, new) -> bool:
+        """速度按相对变化、延迟按绝对变化比较，其余指标按值比较（避免探测抖动刷满变更记录）"""
+        if field == 'speed' and old and new:
+            return abs(new - old) / old > CHANGE_SPEED_DELTA
+        if field == 'rtt' and old is not None and new is not None:
+            return abs(new - old) > CHANGE_RTT_DELTA
+        return old != new
+    
+    @staticmethod
+    def settle_metrics(old_nodes: List[Dict], new_nodes: List[Dict]) -> List[Dict]:
+        """变化未超过阈值的指标沿用上次发布的值
+
+        未写入变更记录的小幅变化也不写入快照，下次比较仍以上次发布的值为基准，
+        小幅变化累积超过阈值后才会记录，按变更记录同步的一方与快照保持一致。
+        """
+        old_map = {NodeStorage.node_identity(node): node for node in old_nodes}
+        settled = []
+        for node in new_nodes:
+            old = old_map.get(NodeStorage.node_identity(node))
+            if old is not None and all(old.get(field) == node.get(field) for field in CONFIG_FIELDS):
+                kept = {field: old[field] for field in METRIC_FIELDS
+                        if field in old and field in node
+                        and not NodeStorage.metric_changed(field, old[field], node[field])}
+                if kept:
+                    node = {**node, **kept}
+            settled.append(node)
+        return settled
+    
+    @staticmethod
+    def compute_diff(old_nodes: List[Dict], new_nodes: List[Dict]) -> Dict:
+        """比较两次发布的节点集合，返回新增、移除和指标变化的节点"""
+        old_map = {NodeStorage.node_identity(node): node for node in old_nodes}
+        new_map = {NodeStorage.node_identity(node): node for node in new_nodes}
+        
+        added = [node for key, node in new_map.items() if key not in old_map]
+        removed = [key for key in old_map if key not in new_map]
+        changed = []
+        for key, node in new_map.items():
+            old = old_map.get(key)
+            if old is None:
+                continue
+            if any(old.get(field) != node.get(field) for field in CONFIG_FIELDS):
+                changed.append({'id': key, 'node': node})
+                continue
+            fields = {field: node.get(field) for field in METRIC_FIELDS
+                      if NodeStorage.metric_changed(field, old.get(field), node.get(field))}
+            if fields:
+                changed.append({'id': key, **fields})
+        
+        return {'added': added, 'removed': removed, 'changed': changed}
+    
+    @staticmethod
+    def load_changes(filename: str = OUTPUT_CHANGES) -> List[Dict]:
+        """读取变更记录"""
+        changes = []
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        changes.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return changes
+    
+    @staticmethod
+    def append_change(diff: Dict, filename: str = OUTPUT_CHANGES) -> int:
+        """追加一条变更记录，超过 CHANGE_FEED_MAX 条时只保留最近的记录，返回序号"""
+        changes = NodeStorage.load_changes(filename)
+        seq = changes[-1]['seq'] + 1 if changes else 1
+        entry = {'seq': seq, 'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), **diff}
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n'
+        
+        if len(changes) >= CHANGE_FEED_MAX:
+            kept = changes[len(changes) - CHANGE_FEED_MAX + 1:]
+            with open(filename, 'w', encoding='utf-8') as f:
+                for change in kept:
+                    f.write(json.dumps(change, ensure_ascii=False, separators=(',', ':')) + '\n')
+                f.write(line)
+        else:
+            with open(filename, 'a', encoding='utf-8') as f:
+                f.write(line)
+        return seq
+    
+    @staticmethod
+    def save_changes(nodes: List[Dict], filename: str = OUTPUT_CHANGES) -> List[Dict]:
+        """与上次发布的 nodes.json 比较，有变化时追加变更记录，返回应写入快照的节点"""
+        try:
+            old_nodes = NodeStorage.load_from_json()
+            nodes = NodeStorage.settle_metrics(old_nodes, nodes)
+            diff = NodeStorage.compute_diff(old_nodes, nodes)
+            if not any(diff.values()):
+                logger.info("节点集合无变化，不追加变更记录")
+                return nodes
+            seq = NodeStorage.append_change(diff, filename)
+            logger.info(f"变更记录 #{seq}: 新增 {len(diff['added'])}，移除 {len(diff['removed'])}，"
+                        f"变化 {len(diff['changed'])}")
+        except Exception as e:
+            logger.error(f"保存变更记录失败: {e}")
+        return nodes
+    
+    @staticmethod
+    def save_all(nodes: List[Dict]) -> List[Dict]:
+        """保存所有格式，返回实际发布的节点"""
+        # 先和旧的 nodes.json 比较，再覆盖
+        nodes = NodeStorage.save_changes(nodes)
         NodeStorage.save_to_txt(nodes)
         NodeStorage.save_to_json(nodes)
         NodeStorage.save_to_clash_yaml(nodes)
+        NodeStorage.save_index(nodes)
+        return nodes
 
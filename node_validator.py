@@ -5,8 +5,7 @@ import asyncio
 import aiohttp
 import time
 import logging
-import socket
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
 from config import TEST_URLS, TIMEOUT, TEST_TIMEOUT, MAX_CONCURRENT
 from proxy_helper import ProxyHelper
 
@@ -20,28 +19,38 @@ class NodeValidator:
         self.semaphore = asyncio.Semaphore(MAX_CONCURRENT)
         self.proxy_helper = ProxyHelper()
     
-    async def test_connection(self, node: Dict) -> bool:
-        """测试节点基本连接（TCP 连接测试）"""
+    async def measure_rtt(self, node: Dict) -> Optional[float]:
+        """TCP 连接延迟（毫秒），连接失败返回 None
+        
+        连接在并发信号量内建立，计时从取得信号量后开始，不包含排队时间。
+        """
+        server = node.get('server', '')
+        port = node.get('port', '')
+        
+        if not server or not port:
+            return None
+        
         try:
-            server = node.get('server', '')
-            port = node.get('port', '')
-            
-            if not server or not port:
-                return False
-            
-            # 尝试 TCP 连接
-            try:
-                port_int = int(port)
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(TIMEOUT)
-                result = sock.connect_ex((server, port_int))
-                sock.close()
-                return result == 0
-            except:
-                return False
+            port_int = int(port)
+            async with self.semaphore:
+                start_time = time.monotonic()
+                _, writer = await asyncio.wait_for(
+                    asyncio.open_connection(server, port_int), timeout=TIMEOUT
+                )
+                rtt = (time.monotonic() - start_time) * 1000
+                writer.close()
+                try:
+                    await asyncio.wait_for(writer.wait_closed(), timeout=TIMEOUT)
+                except Exception:
+                    pass
+            return rtt
         except Exception as e:
-            logger.debug(f"节点连接测试失败: {e}")
-            return False
+            logger.debug(f"节点连接测试失败 {server}:{port}: {e}")
+            return None
+    
+    async def test_connection(self, node: Dict) -> bool:
+        """测试节点基本连接（TCP 连接测试）"""
+        return await self.measure_rtt(node) is not None
     
     async def test_website_access(self, node: Dict, url: str) -> bool:
         """测试网站访问（通过代理）"""
@@ -92,9 +101,11 @@ class NodeValidator:
     async def validate_node(self, node: Dict) -> Optional[Dict]:
         """验证单个节点"""
         try:
-            # 测试基本连接
-            if not await self.test_connection(node):
+            # 测试基本连接，同时记录连接延迟
+            rtt = await self.measure_rtt(node)
+            if rtt is None:
                 return None
+            node['rtt'] = round(rtt, 1)
             
             # 测试流媒体访问
             streaming_results = await self.test_streaming_media(node)
@@ -111,11 +122,18 @@ class NodeValidator:
             logger.debug(f"验证节点失败: {e}")
             return None
     
-    async def validate_nodes(self, nodes: List[Dict]) -> List[Dict]:
-        """批量验证节点"""
+    async def validate_nodes(self, nodes: List[Dict],
+                             on_result: Optional[Callable[[Dict, Optional[Dict]], None]] = None) -> List[Dict]:
+        """批量验证节点，on_result 在每个节点验证完成后调用（用于写检查点）"""
         logger.info(f"开始验证 {len(nodes)} 个节点...")
         
-        tasks = [self.validate_node(node) for node in nodes]
+        async def run(node: Dict) -> Optional[Dict]:
+            result = await self.validate_node(node)
+            if on_result is not None:
+                on_result(node, result)
+            return result
+        
+        tasks = [run(node) for node in nodes]
         results = await asyncio.gather(*tasks, return_exceptions=True)
         
         valid_nodes = []
@@ -0,0 +1,172 @@
+"""
+节点源统计模块 - 记录每个仓库/文件的产出，按产出分配爬取预算和频率
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from config import (
+    OUTPUT_SOURCE_STATS, SOURCE_EMA_ALPHA, SOURCE_BASE_INTERVAL, SOURCE_MAX_INTERVAL,
+    CRAWL_FILE_BUDGET, SOURCE_MIN_FILES, SOURCE_DEAD_RUNS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def ema(old: Optional[float], value: float) -> float:
+    """指数滑动平均，首次直接取当前值"""
+    if old is None:
+        return float(value)
+    return SOURCE_EMA_ALPHA * value + (1 - SOURCE_EMA_ALPHA) * old
+
+
+class SourceStats:
+    """节点源统计
+
+    每个仓库和文件记录节点产出（爬取数、验证通过数）的滑动平均、抓取字节数、
+    最近一次有产出的时间和连续无产出的次数。连续无产出的仓库按指数退避降低爬取频率，
+    每次运行的文件预算按仓库得分分配，仓库内部按文件得分排序抓取。
+
+    守护进程中爬取在线程池里记录统计，同时事件循环线程更新验证数、保存文件，
+    读写 data 的方法都在同一把（可重入）锁内完成。
+    """
+
+    def __init__(self, data: Optional[Dict] = None):
+        self.data = data or {'repos': {}}
+        self.lock = threading.RLock()
+
+    @classmethod
+    def load(cls, filename: str = OUTPUT_SOURCE_STATS) -> 'SourceStats':
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                return cls(json.load(f))
+        except FileNotFoundError:
+            return cls()
+        except Exception as e:
+            logger.error(f"读取节点源统计失败: {e}")
+            return cls()
+
+    def save(self, filename: str = OUTPUT_SOURCE_STATS):
+        try:
+            with self.lock:
+                text = json.dumps(self.data, ensure_ascii=False, indent=1, sort_keys=True)
+            tmp = f"{filename}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp, filename)
+        except Exception as e:
+            logger.error(f"保存节点源统计失败: {e}")
+
+    def repo(self, repo: str) -> Dict:
+        with self.lock:
+            return self.data['repos'].setdefault(repo, {'files': {}, 'empty_runs': 0})
+
+    def file(self, repo: str, path: str) -> Dict:
+        with self.lock:
+            return self.repo(repo)['files'].setdefault(path, {'empty_runs': 0})
+
+    @staticmethod
+    def score(entry: Dict) -> float:
+        """产出得分：验证通过的节点权重最高，爬取到的节点次之"""
+        return entry.get('validated', 0) + 0.1 * entry.get('found', 0)
+
+    # ---- 调度 ----
+
+    def crawl_interval(self, repo: str) -> float:
+        """仓库的爬取间隔：有产出的仓库每次都爬，连续无产出时间隔逐次翻倍"""
+        empty_runs = self.repo(repo).get('empty_runs', 0)
+        if empty_runs == 0:
+            return 0
+        return min(SOURCE_BASE_INTERVAL * (2 ** (empty_runs - 1)), SOURCE_MAX_INTERVAL)
+
+    def is_due(self, repo: str, now: Optional[float] = None) -> bool:
+        last = self.repo(repo).get('last_crawled')
+        if last is None:
+            return True
+        now = time.time() if now is None else now
+        # 留出 10% 余量，避免定时任务的时间抖动让仓库多等一个周期
+        return now - last >= self.crawl_interval(repo) * 0.9
+
+    def plan(self, repos: List[str]) -> Dict[str, int]:
+        """选出本次需要爬取的仓库，并按得分分配文件预算"""
+        with self.lock:
+            due = [repo for repo in repos if self.is_due(repo)]
+            skipped = [repo for repo in repos if repo not in due]
+            if skipped:
+                logger.info(f"以下仓库近期无产出，本次跳过: {', '.join(skipped)}")
+            if not due:
+                return {}
+
+            # 未知仓库按平均得分对待，保证有被探索的机会
+            scores = {repo: self.score(self.repo(repo)) for repo in due}
+            known = [s for repo, s in scores.items() if 'found' in self.repo(repo)]
+            default = sum(known) / len(known) if known else 1.0
+            weights = {repo: (s if 'found' in self.repo(repo) else default) + 1.0 for repo, s in scores.items()}
+            total = sum(weights.values())
+            return {repo: max(SOURCE_MIN_FILES, round(CRAWL_FILE_BUDGET * weight / total))
+                    for repo, weight in weights.items()}
+
+    def order_files(self, repo: str, candidates: List[Dict]) -> List[Dict]:
+        """有产出的文件优先，从未抓取过的文件其次，长期无产出的文件最后（保持原有相对顺序）"""
+        with self.lock:
+            files = self.repo(repo)['files']
+
+            def rank(item: Dict):
+                entry = files.get(item['path'])
+                if entry is None:
+                    return (1, 0.0)
+                if entry.get('empty_runs', 0) >= SOURCE_DEAD_RUNS:
+                    return (2, 0.0)
+                return (0, -self.score(entry))
+
+            return sorted(candidates, key=rank)
+
+    # ---- 记录 ----
+
+    def record_file(self, repo: str, path: str, found: int, fetched_bytes: int):
+        """记录单个文件本次爬取的结果"""
+        with self.lock:
+            entry = self.file(repo, path)
+            entry['found'] = ema(entry.get('found'), found)
+            entry['bytes'] = ema(entry.get('bytes'), fetched_bytes)
+            entry['last_crawled'] = time.time()
+            entry['pending_validation'] = True
+            if found:
+                entry['last_yield'] = entry['last_crawled']
+                entry['empty_runs'] = 0
+            else:
+                entry['empty_runs'] = entry.get('empty_runs', 0) + 1
+
+    def record_repo(self, repo: str, found: int, fetched_bytes: int):
+        """记录仓库本次爬取的结果"""
+        with self.lock:
+            entry = self.repo(repo)
+            entry['found'] = ema(entry.get('found'), found)
+            entry['bytes'] = ema(entry.get('bytes'), fetched_bytes)
+            entry['last_crawled'] = time.time()
+            entry['runs'] = entry.get('runs', 0) + 1
+            entry['pending_validation'] = True
+            if found:
+                entry['last_yield'] = entry['last_crawled']
+                entry['empty_runs'] = 0
+            else:
+                entry['empty_runs'] = entry.get('empty_runs', 0) + 1
+
+    def record_validated(self, valid_nodes: List[Dict]):
+        """按节点来源统计验证通过数，更新本次爬取过的仓库和文件"""
+        with self.lock:
+            counts: Dict[tuple, int] = {}
+            for node in valid_nodes:
+                repo, path = node.get('source_repo'), node.get('source_file')
+                if repo:
+                    counts[(repo, None)] = counts.get((repo, None), 0) + 1
+                    counts[(repo, path)] = counts.get((repo, path), 0) + 1
+
+            for repo, repo_entry in self.data['repos'].items():
+                if repo_entry.pop('pending_validation', False):
+                    repo_entry['validated'] = ema(repo_entry.get('validated'), counts.get((repo, None), 0))
+                for path, file_entry in repo_entry['files'].items():
+                    if file_entry.pop('pending_validation', False):
+                        file_entry['validated'] = ema(file_entry.get('validated'), counts.get((repo, path), 0))
@@ -0,0 +1,130 @@
+"""
+本地限速测速服务 - 模拟带宽受限的下载源，用于验证持续带宽测速
+
+用法:
+    python speedtest_server.py --rate 300 --per-connection 120 --port 8081
+
+然后在 config.py 中设置:
+    SPEED_TEST_MODE = "throughput"
+    THROUGHPUT_URL = "http://127.0.0.1:8081/bytes/104857600"
+"""
+import argparse
+import asyncio
+import logging
+import re
+from typing import Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 16 * 1024
+DEFAULT_SIZE = 100 * 1024 * 1024
+
+
+class TokenBucket:
+    """令牌桶限速（字节/秒），rate 为 0 表示不限速"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(rate / 10, CHUNK_SIZE)
+        self.tokens = self.capacity
+        self.updated = None
+
+    async def consume(self, amount: int):
+        if not self.rate:
+            return
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self.updated is not None:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class ShapedServer:
+    """按总带宽和单连接带宽限速的 HTTP 下载服务（支持 keep-alive 和 Range）"""
+
+    def __init__(self, rate_kb: float = 0, per_connection_kb: float = 0, latency: float = 0):
+        self.total = TokenBucket(rate_kb * 1024)
+        self.per_connection_rate = per_connection_kb * 1024
+        self.latency = latency
+
+    async def send_body(self, writer: asyncio.StreamWriter, size: int, bucket: TokenBucket):
+        chunk = b'\0' * CHUNK_SIZE
+        remaining = size
+        while remaining > 0:
+            amount = min(CHUNK_SIZE, remaining)
+            await bucket.consume(amount)
+            await self.total.consume(amount)
+            writer.write(chunk[:amount])
+            await writer.drain()
+            remaining -= amount
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        bucket = TokenBucket(self.per_connection_rate)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                parts = request_line.decode('latin-1').split()
+                # 经代理转发时请求目标是完整 URL（含主机和端口），只从路径中取大小
+                match = re.search(r'(\d+)', urlsplit(parts[1]).path) if len(parts) > 1 else None
+                size = int(match.group(1)) if match else DEFAULT_SIZE
+
+                status = '200 OK'
+                range_match = re.match(r'bytes=(\d+)-(\d*)', headers.get('range', ''))
+                if range_match:
+                    start = int(range_match.group(1))
+                    end = int(range_match.group(2)) if range_match.group(2) else size - 1
+                    size = max(0, min(end, size - 1) - start + 1)
+                    status = '206 Partial Content'
+
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                writer.write((f"HTTP/1.1 {status}\r\nContent-Type: application/octet-stream\r\n"
+                              f"Content-Length: {size}\r\n\r\n").encode('latin-1'))
+                await self.send_body(writer, size, bucket)
+
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_forever(self, host: str = '127.0.0.1', port: int = 8081):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        logger.info(f"限速测速服务已启动: http://{host}:{port}/bytes/{DEFAULT_SIZE}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地限速测速服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--rate', type=float, default=0, help="总带宽上限（KB/s，0 为不限）")
+    parser.add_argument('--per-connection', type=float, default=0, help="单连接带宽上限（KB/s，0 为不限）")
+    parser.add_argument('--latency', type=float, default=0, help="每个请求的首字节延迟（秒）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = ShapedServer(args.rate, args.per_connection, args.latency)
+    asyncio.run(server.serve_forever(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+订阅服务模块 - 从内存直接提供节点订阅（预压缩 + ETag 缓存）
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+from config import (
+    SERVER_HOST, SERVER_PORT, SERVER_CACHE_SIZE, SERVER_KEEPALIVE_TIMEOUT, SERVER_GZIP_LEVEL,
+    SERVER_BROTLI_QUALITY, SERVER_RELOAD_INTERVAL, OUTPUT_NODES_INDEX, OUTPUT_NODES_JSON, OUTPUT_CHANGES,
+)
+from node_index import NodeIndex
+from node_storage import NodeStorage
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 路由 -> (渲染函数, Content-Type)
+ROUTES = {
+    '/nodes.txt': (NodeStorage.render_txt, 'text/plain; charset=utf-8'),
+    '/nodes.json': (NodeStorage.render_json, 'application/json; charset=utf-8'),
+    '/clash.yaml': (NodeStorage.render_clash_yaml, 'text/yaml; charset=utf-8'),
+    '/clash_config.yaml': (NodeStorage.render_clash_yaml, 'text/yaml; charset=utf-8'),
+}
+
+# 支持的筛选参数
+FILTER_PARAMS = ('protocol', 'region', 'min_speed', 'site')
+
+STATUS_TEXT = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+class CachedResponse:
+    """渲染一次后缓存的响应：各编码的响应体与对应的强 ETag"""
+
+    def __init__(self, body: bytes, content_type: str):
+        self.content_type = content_type
+        digest = hashlib.sha1(body).hexdigest()[:20]
+        # mtime 固定为 0，同一内容每次压缩结果一致，强 ETag 才成立
+        self.bodies = {'identity': body, 'gzip': gzip.compress(body, compresslevel=SERVER_GZIP_LEVEL, mtime=0)}
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(body, quality=SERVER_BROTLI_QUALITY)
+        # 强 ETag 必须区分不同编码的表示
+        self.etags = {encoding: f'"{digest}-{encoding}"' for encoding in self.bodies}
+
+    def select(self, accept_encoding: str) -> str:
+        """根据 Accept-Encoding 选择最小的可用编码"""
+        accepted = set()
+        for item in accept_encoding.split(','):
+            parts = item.strip().split(';')
+            name = parts[0].strip().lower()
+            if any(p.strip() in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000') for p in parts[1:]):
+                continue
+            accepted.add(name)
+        for encoding in ('br', 'gzip'):
+            if encoding in self.bodies and (encoding in accepted or '*' in accepted):
+                return encoding
+        return 'identity'
+
+
+class SubscriptionServer:
+    """基于 asyncio 的订阅 HTTP 服务"""
+
+    def __init__(self, host: str = SERVER_HOST, port: int = SERVER_PORT):
+        self.host = host
+        self.port = port
+        self.index = NodeIndex()
+        self.changes: List[Dict] = []
+        self.cache: Dict[Tuple, CachedResponse] = {}
+        # 正在渲染的视图，同一视图的并发请求共用一次渲染
+        self.rendering: Dict[Tuple, asyncio.Future] = {}
+        # 节点集合每次替换时递增，旧集合渲染出的结果不再写入缓存
+        self.generation = 0
+
+    def update(self, nodes: List[Dict]):
+        """替换节点集合，所有已渲染的视图随之失效"""
+        self.update_index(NodeIndex(nodes))
+
+    def update_index(self, index: NodeIndex):
+        """直接替换为已建好的索引（例如磁盘快照）"""
+        self.set_snapshot(index, NodeStorage.load_changes())
+        logger.info(f"订阅服务已更新，共 {len(index)} 个节点")
+
+    def set_snapshot(self, index: NodeIndex, changes: List[Dict]):
+        """替换索引和变更记录，清空已渲染的视图"""
+        self.index = index
+        self.changes = changes
+        self.generation += 1
+        self.cache.clear()
+        self.rendering.clear()
+
+    @staticmethod
+    def normalize_query(query: str) -> Tuple:
+        """只保留已知筛选参数并排序，作为缓存键的一部分"""
+        params = {}
+        for name, value in parse_qsl(query):
+            if name in FILTER_PARAMS and value:
+                params[name] = value.lower()
+        return tuple(sorted(params.items()))
+
+    def filter_nodes(self, params: Dict[str, str]) -> List[Dict]:
+        """按协议、地区、最低速度、流媒体站点筛选节点"""
+        split = lambda name: params[name].split(',') if name in params else None
+        min_speed = float(params['min_speed']) if 'min_speed' in params else None
+        nodes = self.index.query(protocol=split('protocol'), country=split('region'),
+                                 site=split('site'), min_speed=min_speed)
+        if 'region' in params and not nodes:
+            # 没有地区数据的节点，退回按名称匹配
+            regions = split('region')
+            nodes = [n for n in self.index.query(protocol=split('protocol'), site=split('site'),
+                                                 min_speed=min_speed)
+                     if any(r in str(n.get('name', '')).lower() for r in regions)]
+        return nodes
+
+    def render_changes(self, since: int) -> str:
+        """增量订阅：返回序号大于 since 的变更记录
+
+        since 早于保留的最早记录时返回 reset，客户端需要重新拉取完整快照。
+        """
+        latest = self.changes[-1]['seq'] if self.changes else 0
+        reset = bool(self.changes) and since < self.changes[0]['seq'] - 1
+        entries = [] if reset else [change for change in self.changes if change['seq'] > since]
+        return json.dumps({'seq': latest, 'reset': reset, 'changes': entries},
+                          ensure_ascii=False, separators=(',', ':'))
+
+    def cache_key(self, path: str, query: str) -> Optional[Tuple]:
+        """视图的缓存键，未知路径返回 None"""
+        if path == '/changes':
+            return (path, int(dict(parse_qsl(query)).get('since', 0)))
+        if path in ROUTES:
+            return (path, self.normalize_query(query))
+        return None
+
+    def render(self, key: Tuple) -> CachedResponse:
+        """渲染并压缩一个视图（在线程池中执行）"""
+        path, arg = key
+        if path == '/changes':
+            body = self.render_changes(arg).encode('utf-8')
+            content_type = 'application/json; charset=utf-8'
+        else:
+            render, content_type = ROUTES[path]
+            body = render(self.filter_nodes(dict(arg))).encode('utf-8')
+        return CachedResponse(body, content_type)
+
+    async def get_response(self, path: str, query: str) -> Optional[CachedResponse]:
+        """取出（必要时渲染）某个视图的缓存响应；渲染和压缩不在事件循环线程上执行"""
+        key = self.cache_key(path, query)
+        if key is None:
+            return None
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        future = self.rendering.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        generation = self.generation
+        future = asyncio.get_running_loop().run_in_executor(None, self.render, key)
+        self.rendering[key] = future
+        try:
+            cached = await future
+        finally:
+            if self.rendering.get(key) is future:
+                del self.rendering[key]
+        if generation == self.generation:
+            if len(self.cache) >= SERVER_CACHE_SIZE:
+                self.cache.clear()
+            self.cache[key] = cached
+        return cached
+
+    @staticmethod
+    def build_response(status: int, headers: Dict[str, str], body: bytes = b'') -> bytes:
+        """拼接 HTTP/1.1 响应"""
+        lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}"]
+        headers['Content-Length'] = str(len(body))
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+    async def respond(self, method: str, target: str, headers: Dict[str, str]) -> bytes:
+        """处理单个请求，返回完整响应字节"""
+        if method not in ('GET', 'HEAD'):
+            return self.build_response(405, {'Allow': 'GET, HEAD'})
+
+        url = urlsplit(target)
+        try:
+            cached = await self.get_response(url.path, url.query)
+        except ValueError:
+            return self.build_response(400, {'Content-Type': 'text/plain'}, b'bad filter\n')
+        if cached is None:
+            return self.build_response(404, {'Content-Type': 'text/plain'}, b'not found\n')
+
+        encoding = cached.select(headers.get('accept-encoding', ''))
+        etag = cached.etags[encoding]
+        response_headers = {'ETag': etag, 'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+
+        if_none_match = headers.get('if-none-match', '')
+        if etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+            return self.build_response(304, response_headers)
+
+        response_headers['Content-Type'] = cached.content_type
+        if encoding != 'identity':
+            response_headers['Content-Encoding'] = encoding
+        body = cached.bodies[encoding]
+        if method == 'HEAD':
+            response = self.build_response(200, response_headers, body)
+            return response[:len(response) - len(body)]
+        return self.build_response(200, response_headers, body)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个连接上的所有请求（支持 keep-alive）"""
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), timeout=SERVER_KEEPALIVE_TIMEOUT)
+                if not request_line:
+                    break
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    writer.write(self.build_response(400, {'Connection': 'close'}))
+                    break
+
+                headers = {}
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), timeout=SERVER_KEEPALIVE_TIMEOUT)
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                method, target, version = parts
+                writer.write(await self.respond(method, target, headers))
+                await writer.drain()
+
+                connection = headers.get('connection', '').lower()
+                if connection == 'close' or (version == 'HTTP/1.0' and connection != 'keep-alive'):
+                    break
+        except (asyncio.TimeoutError, ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        except Exception as e:
+            logger.debug(f"处理订阅请求失败: {e}")
+        finally:
+            writer.close()
+
+    @staticmethod
+    def snapshot_mtimes(*filenames: str) -> Tuple:
+        """各输出文件的修改时间，文件不存在时为 None"""
+        mtimes = []
+        for filename in filenames:
+            try:
+                mtimes.append(os.stat(filename).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    async def watch_snapshot(self, index_file: str = OUTPUT_NODES_INDEX, changes_file: str = OUTPUT_CHANGES,
+                             json_file: str = OUTPUT_NODES_JSON, interval: float = SERVER_RELOAD_INTERVAL):
+        """仅订阅服务模式：索引快照、nodes.json 或变更记录被其他进程更新后重新加载"""
+        loop = asyncio.get_running_loop()
+        mtimes = self.snapshot_mtimes(index_file, json_file, changes_file)
+        while True:
+            await asyncio.sleep(interval)
+            current = self.snapshot_mtimes(index_file, json_file, changes_file)
+            if current == mtimes:
+                continue
+            mtimes = current
+            try:
+                index = await loop.run_in_executor(None, NodeStorage.load_index, index_file, json_file)
+                changes = await loop.run_in_executor(None, NodeStorage.load_changes, changes_file)
+            except Exception as e:
+                logger.error(f"重新加载索引快照失败: {e}")
+                continue
+            self.set_snapshot(index, changes)
+            logger.info(f"检测到输出文件更新，已重新加载 {len(index)} 个节点")
+
+    async def serve_forever(self):
+        """启动订阅服务"""
+        server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        logger.info(f"订阅服务已启动: http://{self.host}:{self.port}/nodes.txt")
+        async with server:
+            await server.serve_forever()
@@ -0,0 +1,18 @@
+"""
+检查点测试
+"""
+from checkpoint import Checkpoint
+
+
+def test_torn_last_line_is_truncated_before_append(tmp_path):
+    path = tmp_path / 'validate.jsonl'
+    path.write_text('{"key":"a","node":{"x":1}}\n{"key":"b","node":{"x"', encoding='utf-8')
+
+    checkpoint = Checkpoint('validate', directory=str(tmp_path))
+    assert checkpoint.processed_keys() == {'a'}
+    checkpoint.append({'key': 'c', 'node': {'x': 3}})
+    checkpoint.finish()
+
+    reloaded = Checkpoint('validate', directory=str(tmp_path))
+    assert reloaded.done
+    assert reloaded.processed_keys() == {'a', 'c'}
@@ -0,0 +1,61 @@
+"""
+命令行入口测试
+"""
+import asyncio
+import sys
+import types
+
+import pytest
+
+import main
+
+
+def run_cli(monkeypatch, argv):
+    """执行 cli，记录被调用的入口而不真正运行流程"""
+    calls = []
+
+    async def fake_main(fresh=False):
+        calls.append(('run', fresh))
+
+    monkeypatch.setattr(main, 'setup_logging', lambda **kwargs: None)
+    monkeypatch.setattr(main, 'main', fake_main)
+    main.cli(argv)
+    return calls
+
+
+def test_bare_invocation_runs_full_pipeline(monkeypatch):
+    assert main.build_parser().parse_args([]).command == 'run'
+    assert run_cli(monkeypatch, []) == [('run', False)]
+
+
+def test_run_subcommand_fresh(monkeypatch):
+    assert run_cli(monkeypatch, ['run', '--fresh']) == [('run', True)]
+
+
+def test_export_rejects_fresh():
+    parser = main.build_parser()
+    assert parser.parse_args(['export']).command == 'export'
+    with pytest.raises(SystemExit):
+        parser.parse_args(['export', '--fresh'])
+
+
+def test_empty_crawl_is_retried_on_next_run(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    crawls = []
+
+    class FakeCrawler:
+        def __init__(self, stats=None):
+            pass
+
+        def crawl_all(self, repos):
+            crawls.append(repos)
+            return []
+
+    fake = types.ModuleType('node_crawler')
+    fake.GitHubNodeCrawler = FakeCrawler
+    fake.node_key = lambda node: f"{node.get('server', '')}:{node.get('port', '')}"
+    monkeypatch.setitem(sys.modules, 'node_crawler', fake)
+
+    asyncio.run(main.main())
+    asyncio.run(main.main())
+    assert len(crawls) == 2
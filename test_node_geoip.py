@@ -0,0 +1,68 @@
+"""
+离线 IP 归属地测试
+"""
+from node_geoip import GeoIPLookup, build_database, ip_to_int
+
+CSV = """\
+1.0.0.0,1.0.0.255,AU,AS13335
+1.0.4.0,1.0.7.255,au,38803
+16779264,16779519,jp,as2497
+8.8.8.0,8.8.8.255,US,AS15169
+9.9.9.9,9.9.9.0,US,AS1
+2001:db8::,2001:db8::ffff,DE,AS3320
+10.0.0.0,10.0.0.255,CN,
+bad,row
+"""
+
+
+def build(tmp_path) -> GeoIPLookup:
+    csv_file, db_file = tmp_path / 'geoip.csv', tmp_path / 'geoip.bin'
+    csv_file.write_text(CSV, encoding='utf-8')
+    build_database(str(csv_file), str(db_file))
+    return GeoIPLookup(str(db_file))
+
+
+def test_invalid_rows_are_skipped(tmp_path):
+    # 结束地址小于起始地址、IPv6、列数不足的行不收录
+    assert build(tmp_path).count == 5
+
+
+def test_range_ends_and_gaps(tmp_path):
+    lookup = build(tmp_path)
+    assert lookup.lookup('1.0.0.0') == ('AU', 13335)
+    assert lookup.lookup('1.0.0.255') == ('AU', 13335)
+    assert lookup.lookup('1.0.1.0') is None
+    assert lookup.lookup('1.0.3.255') is None
+    assert lookup.lookup('1.0.4.0') == ('AU', 38803)
+    assert lookup.lookup('1.0.7.255') == ('AU', 38803)
+    # 整数形式的区间（1.0.8.0 - 1.0.8.255）
+    assert lookup.lookup('1.0.8.0') == ('JP', 2497)
+    assert lookup.lookup('1.0.8.255') == ('JP', 2497)
+    assert lookup.lookup('1.0.9.0') is None
+    assert lookup.lookup('0.255.255.255') is None
+    assert lookup.lookup('8.8.8.8') == ('US', 15169)
+    assert lookup.lookup('8.8.9.0') is None
+    assert lookup.lookup('255.255.255.255') is None
+
+
+def test_asn_parsing(tmp_path):
+    lookup = build(tmp_path)
+    # 大小写不同的 AS 前缀、纯数字、缺失都能解析，缺失记为 0
+    assert lookup.lookup('1.0.0.1')[1] == 13335
+    assert lookup.lookup('1.0.8.1')[1] == 2497
+    assert lookup.lookup('1.0.4.1')[1] == 38803
+    assert lookup.lookup('10.0.0.1') == ('CN', 0)
+
+
+def test_non_ipv4_is_not_looked_up(tmp_path):
+    lookup = build(tmp_path)
+    assert ip_to_int('example.com') is None
+    assert lookup.lookup('2001:db8::1') is None
+    assert lookup.lookup('1.0.0') is None
+
+
+def test_annotate(tmp_path):
+    nodes = [{'server': '8.8.8.8'}, {'server': 'example.com'}, {'server': 'x', 'ip': '1.0.0.1'}]
+    assert build(tmp_path).annotate(nodes) == 2
+    assert nodes[0]['country'] == 'US' and nodes[2]['asn'] == 13335
+    assert 'country' not in nodes[1]
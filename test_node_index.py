@@ -0,0 +1,70 @@
+"""
+节点索引测试
+"""
+import node_index
+from node_index import NodeIndex
+
+
+def make_nodes():
+    return [
+        {'type': 'ss', 'port': 443, 'speed': 99.9, 'rtt': 40.0, 'country': 'US',
+         'streaming_access': {'netflix': True, 'youtube': True}},
+        {'type': 'vmess', 'port': 443, 'speed': 100.0, 'rtt': 120.0, 'country': 'JP',
+         'streaming_access': {'netflix': True, 'youtube': False}},
+        {'type': 'vless', 'port': 8443, 'speed': 150.0, 'rtt': None, 'country': 'JP',
+         'streaming_access': {'youtube': True}},
+        {'type': 'trojan', 'port': 443, 'speed': 249.9, 'rtt': 99.9,
+         'streaming_access': {'netflix': True, 'youtube': True}},
+        {'type': 'ss', 'port': 80, 'speed': 250.0, 'rtt': 100.0, 'country': 'us'},
+    ]
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / 'nodes.idx')
+    index = NodeIndex(make_nodes())
+    index.save(path)
+
+    loaded = NodeIndex.load(path)
+    assert len(loaded) == len(index)
+    assert loaded.query(min_speed=100, max_rtt=100) == index.query(min_speed=100, max_rtt=100)
+    assert list(loaded.nodes) == make_nodes()
+
+
+def test_snapshot_with_other_bucket_size_is_rejected(tmp_path, monkeypatch):
+    path = str(tmp_path / 'nodes.idx')
+    NodeIndex(make_nodes()).save(path)
+
+    monkeypatch.setitem(node_index.RANGE_FIELDS, 'speed', 7)
+    assert NodeIndex.load(path) is None
+
+
+def test_speed_range_bucket_edges():
+    index = NodeIndex(make_nodes())
+    # 100 和 250 恰好落在桶边界（桶宽 50），99.9 / 249.9 在相邻桶的末尾
+    assert [n['speed'] for n in index.query(min_speed=100)] == [100.0, 150.0, 249.9, 250.0]
+    assert [n['speed'] for n in index.query(min_speed=100, max_speed=249.9)] == [100.0, 150.0, 249.9]
+    assert [n['speed'] for n in index.query(max_speed=99.9)] == [99.9]
+    assert index.query(min_speed=250.1) == []
+
+
+def test_range_checked_on_intersection():
+    index = NodeIndex(make_nodes())
+    assert [n['speed'] for n in index.query(port=443, min_speed=100)] == [100.0, 249.9]
+    # rtt 缺失的节点不满足延迟条件
+    assert [n['rtt'] for n in index.query(max_rtt=100)] == [40.0, 99.9, 100.0]
+    assert [n['rtt'] for n in index.query(country='jp', max_rtt=200)] == [120.0]
+
+
+def test_multiple_sites_require_all():
+    index = NodeIndex(make_nodes())
+    assert [n['type'] for n in index.query(site=['netflix', 'youtube'])] == ['ss', 'trojan']
+    assert [n['type'] for n in index.query(site='netflix')] == ['ss', 'vmess', 'trojan']
+    assert index.query(site=['netflix', 'disney']) == []
+
+
+def test_any_of_values_and_limit():
+    index = NodeIndex(make_nodes())
+    assert [n['type'] for n in index.query(protocol=['SS', 'trojan'])] == ['ss', 'trojan', 'ss']
+    assert [n['type'] for n in index.query(country='US')] == ['ss', 'ss']
+    assert [n['type'] for n in index.query(port=443, limit=2)] == ['ss', 'vmess']
+    assert len(index.query(limit=3)) == 3
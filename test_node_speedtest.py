@@ -0,0 +1,38 @@
+"""
+持续带宽测速测试：以本地限速服务作为代理，测量单连接限速下单流与多流的带宽
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from node_speedtest import NodeSpeedTest
+from speedtest_server import ShapedServer
+
+PER_CONNECTION_KB = 100
+URL = 'http://speedtest.invalid/bytes/104857600'
+
+
+async def measure(streams: int) -> float:
+    shaped = ShapedServer(per_connection_kb=PER_CONNECTION_KB)
+    server = await asyncio.start_server(shaped.handle_client, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        # 限速服务直接响应代理形式（完整 URL）的请求，充当节点代理
+        return await NodeSpeedTest().measure_throughput({'server': '127.0.0.1'}, streams=streams, window=2.5,
+                                                        url=URL, proxy=f'http://127.0.0.1:{port}')
+    finally:
+        server.close()
+
+
+def test_per_connection_cap_shows_with_multiple_streams():
+    single = asyncio.run(measure(1))
+    multiple = asyncio.run(measure(3))
+    assert PER_CONNECTION_KB * 0.6 < single < PER_CONNECTION_KB * 1.4
+    assert multiple > single * 2
+
+
+def test_no_proxy_means_not_measured():
+    node = {'type': 'vmess', 'server': '127.0.0.1', 'port': 1}
+    assert asyncio.run(NodeSpeedTest().measure_throughput(node, url=URL)) is None
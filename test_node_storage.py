@@ -0,0 +1,49 @@
+"""
+节点存储测试（变更记录、索引快照加载）
+"""
+import os
+
+from node_storage import NodeStorage
+
+
+def node(**fields):
+    return {'type': 'ss', 'server': '1.2.3.4', 'port': 443, 'speed': 200.0, 'rtt': 80.0, **fields}
+
+
+def test_rtt_jitter_is_not_a_change():
+    diff = NodeStorage.compute_diff([node()], [node(rtt=80.2)])
+    assert diff == {'added': [], 'removed': [], 'changed': []}
+
+
+def test_large_rtt_change_is_reported():
+    diff = NodeStorage.compute_diff([node()], [node(rtt=300.0)])
+    assert diff['changed'] == [{'id': '1.2.3.4:443', 'rtt': 300.0}]
+
+
+def test_small_drift_accumulates_until_reported(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    NodeStorage.save_to_json(NodeStorage.save_changes([node(speed=200.0)]))
+
+    for speed in (230.0, 250.0):
+        published = NodeStorage.save_changes([node(speed=speed)])
+        NodeStorage.save_to_json(published)
+
+    changes = NodeStorage.load_changes()
+    assert [change['changed'] for change in changes[1:]] == [[{'id': '1.2.3.4:443', 'speed': 250.0}]]
+    assert NodeStorage.load_from_json()[0]['speed'] == 250.0
+
+
+def test_below_threshold_keeps_published_value():
+    settled = NodeStorage.settle_metrics([node()], [node(speed=210.0, rtt=90.0)])
+    assert settled[0]['speed'] == 200.0 and settled[0]['rtt'] == 80.0
+
+
+def test_newer_json_wins_over_stale_index(tmp_path):
+    index_file, json_file = str(tmp_path / 'nodes.idx'), str(tmp_path / 'nodes.json')
+    NodeStorage.save_index([node()], index_file)
+    NodeStorage.save_to_json([node(), node(server='5.6.7.8')], json_file)
+    os.utime(index_file, (1, 1))
+
+    assert len(NodeStorage.load_index(index_file, json_file)) == 2
+    os.utime(json_file, (0, 0))
+    assert len(NodeStorage.load_index(index_file, json_file)) == 1
@@ -0,0 +1,73 @@
+"""
+节点源统计测试
+"""
+from config import CRAWL_FILE_BUDGET, SOURCE_BASE_INTERVAL, SOURCE_MAX_INTERVAL, SOURCE_MIN_FILES
+from source_stats import SourceStats
+
+
+def test_backoff_doubles_and_is_capped():
+    stats = SourceStats()
+    assert stats.crawl_interval('a/b') == 0
+    assert stats.is_due('a/b')
+
+    stats.record_repo('a/b', found=0, fetched_bytes=100)
+    assert stats.crawl_interval('a/b') == SOURCE_BASE_INTERVAL
+    stats.record_repo('a/b', found=0, fetched_bytes=100)
+    assert stats.crawl_interval('a/b') == SOURCE_BASE_INTERVAL * 2
+
+    for _ in range(30):
+        stats.record_repo('a/b', found=0, fetched_bytes=100)
+    assert stats.crawl_interval('a/b') == SOURCE_MAX_INTERVAL
+
+    stats.record_repo('a/b', found=5, fetched_bytes=100)
+    assert stats.crawl_interval('a/b') == 0
+
+
+def test_is_due_after_interval():
+    stats = SourceStats()
+    stats.record_repo('a/b', found=0, fetched_bytes=100)
+    last = stats.repo('a/b')['last_crawled']
+    # 间隔留有 10% 余量
+    assert not stats.is_due('a/b', now=last + SOURCE_BASE_INTERVAL * 0.9 - 1)
+    assert stats.is_due('a/b', now=last + SOURCE_BASE_INTERVAL * 0.9)
+
+
+def test_plan_skips_backed_off_repos_and_favors_productive_ones():
+    stats = SourceStats()
+    stats.record_repo('good/repo', found=50, fetched_bytes=100)
+    stats.record_validated([{'source_repo': 'good/repo', 'source_file': 'a.txt'}] * 20)
+    stats.record_repo('poor/repo', found=1, fetched_bytes=100)
+    stats.record_repo('dead/repo', found=0, fetched_bytes=100)
+
+    budgets = stats.plan(['good/repo', 'poor/repo', 'dead/repo', 'new/repo'])
+    assert 'dead/repo' not in budgets
+    assert budgets['good/repo'] > budgets['new/repo'] >= budgets['poor/repo'] >= SOURCE_MIN_FILES
+    assert sum(budgets.values()) <= CRAWL_FILE_BUDGET + len(budgets)
+
+
+def test_plan_with_nothing_due():
+    stats = SourceStats()
+    stats.record_repo('dead/repo', found=0, fetched_bytes=100)
+    assert stats.plan(['dead/repo']) == {}
+
+
+def test_record_validated_only_updates_crawled_entries():
+    stats = SourceStats()
+    stats.record_file('a/b', 'x.txt', found=3, fetched_bytes=100)
+    stats.record_repo('a/b', found=3, fetched_bytes=100)
+    stats.record_validated([{'source_repo': 'a/b', 'source_file': 'x.txt'}])
+    assert stats.repo('a/b')['validated'] == 1
+    assert stats.file('a/b', 'x.txt')['validated'] == 1
+
+    # 本次未爬取的条目不再更新
+    stats.record_validated([])
+    assert stats.repo('a/b')['validated'] == 1
+
+
+def test_save_and_load(tmp_path):
+    filename = str(tmp_path / 'source_stats.json')
+    stats = SourceStats()
+    stats.record_repo('a/b', found=2, fetched_bytes=100)
+    stats.save(filename)
+    assert SourceStats.load(filename).repo('a/b')['found'] == 2
+    assert SourceStats.load(str(tmp_path / 'missing.json')).data == {'repos': {}}
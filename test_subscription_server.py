@@ -0,0 +1,72 @@
+"""
+订阅服务测试
+"""
+import asyncio
+import gzip
+
+from node_index import NodeIndex
+from subscription_server import SubscriptionServer
+
+NODES = [
+    {'type': 'ss', 'server': '1.1.1.1', 'port': 443, 'name': 'a', 'speed': 120.0, 'raw': 'ss://a'},
+    {'type': 'vmess', 'server': '2.2.2.2', 'port': 443, 'name': 'b', 'speed': 250.0, 'raw': 'vmess://b'},
+]
+
+
+def make_server() -> SubscriptionServer:
+    server = SubscriptionServer()
+    server.set_snapshot(NodeIndex(NODES), [{'seq': 1, 'added': [], 'removed': ['x:1'], 'changed': []}])
+    return server
+
+
+def request(server: SubscriptionServer, target: str, **headers) -> tuple:
+    """返回 (状态码, 响应头, 响应体)"""
+    headers = {name.replace('_', '-'): value for name, value in headers.items()}
+    raw = asyncio.run(server.respond('GET', target, headers))
+    head, _, body = raw.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    response_headers = dict(line.split(': ', 1) for line in lines[1:])
+    return int(lines[0].split()[1]), response_headers, body
+
+
+def test_etag_differs_per_encoding():
+    server = make_server()
+    status, plain, body = request(server, '/nodes.txt')
+    _, gzipped, gzip_body = request(server, '/nodes.txt', accept_encoding='gzip')
+    assert status == 200
+    assert 'Content-Encoding' not in plain and gzipped['Content-Encoding'] == 'gzip'
+    assert plain['ETag'] != gzipped['ETag']
+    assert gzip.decompress(gzip_body) == body
+
+
+def test_if_none_match_returns_304():
+    server = make_server()
+    _, headers, _ = request(server, '/nodes.txt', accept_encoding='gzip')
+    status, _, body = request(server, '/nodes.txt', accept_encoding='gzip', if_none_match=headers['ETag'])
+    assert status == 304 and body == b''
+    # 另一种编码的 ETag 不能命中
+    status, _, _ = request(server, '/nodes.txt', if_none_match=headers['ETag'])
+    assert status == 200
+
+
+def test_etag_stable_across_rerender():
+    server = make_server()
+    _, first, _ = request(server, '/nodes.txt', accept_encoding='gzip')
+    server.set_snapshot(NodeIndex(NODES), [])
+    _, second, _ = request(server, '/nodes.txt', accept_encoding='gzip')
+    assert first['ETag'] == second['ETag']
+
+
+def test_filters_and_bad_parameters():
+    server = make_server()
+    _, _, body = request(server, '/nodes.txt?min_speed=200')
+    assert b'vmess://b' in body and b'ss://a' not in body
+    assert request(server, '/nodes.txt?min_speed=fast')[0] == 400
+    assert request(server, '/changes?since=abc')[0] == 400
+    assert request(server, '/missing')[0] == 404
+
+
+def test_changes_since():
+    server = make_server()
+    _, _, body = request(server, '/changes?since=1')
+    assert body == b'{"seq":1,"reset":false,"changes":[]}'